@@ -0,0 +1,207 @@
+# Structure of saved packings: pair correlation, contacts, overlaps and local volume fraction
+
+import argparse
+import json
+import math
+import numpy as np
+from cell_list import CellList
+from vectorized import minimum_image
+from jamming import packing_fraction
+from trajectory import TrajectoryReader
+
+def load_balls(path, L=None):
+    '''
+    Positions and radii of the balls in a file written by save_balls, without the images
+    Older files have no image column, their images are the rows outside the box of
+    length L and the rows repeating the position of an earlier row. Without L only the
+    repeated rows are dropped.
+    '''
+    data = np.loadtxt(path, delimiter=',', ndmin=2)
+    if data.shape[1] > 4:
+        real = data[:,4] == 0
+    else:
+        real = np.zeros(len(data), dtype=bool)
+        real[np.unique(data[:,1:4], axis=0, return_index=True)[1]] = True
+        if L is not None:
+            real &= ((data[:,1:4] >= 0) & (data[:,1:4] < L)).all(axis=1)
+    return data[real,1:4], data[real,0]
+
+def all_pairs(N, chunk=1 << 22):
+    '''
+    Every pair (i, j) with i < j in chunks of about chunk pairs
+    '''
+    rows = max(1, chunk // max(N, 1))
+    others = np.arange(N)
+    for start in range(0, N, rows):
+        block = np.arange(start, min(start + rows, N))
+        i = np.repeat(block, N)
+        j = np.tile(others, len(block))
+        keep = i < j
+        yield i[keep], j[keep]
+
+def pair_distances(pos, L, cutoff, periodic=False):
+    '''
+    Pairs (i, j) of balls closer than cutoff and their distance, in chunks
+    The pairs come from a CellList, with the minimum image in a periodic box.
+    '''
+    if periodic and cutoff > L/2:
+        raise ValueError("Cutoff {} is longer than half the periodic box {}".format(cutoff, L))
+    cells = CellList(L, cutoff, periodic).build(pos)
+    # A periodic grid of fewer than 3 cells has neighbors on both sides, look at every pair
+    chunks = all_pairs(len(pos)) if periodic and cells.n < 3 else cells.half_pairs()
+    for i, j in chunks:
+        r = pos[i] - pos[j]
+        if periodic:
+            r = minimum_image(r, L)
+        dist = np.sqrt(np.einsum('ij,ij->i', r, r))
+        close = dist < cutoff
+        yield i[close], j[close], dist[close]
+
+def lens_volume(d, R, r):
+    '''
+    Volume of a ball of radius r at distance d from the center of a sphere of radius R
+    that lies inside the sphere
+    '''
+    d, R, r = np.broadcast_arrays(np.asarray(d, dtype=float), R, r)
+    volume = np.zeros(d.shape)
+    inside = d <= np.abs(R - r)
+    small = np.minimum(R, r)
+    volume[inside] = (4/3)*math.pi*small[inside]**3
+    cut = ~inside & (d < R + r)
+    d, R, r = d[cut], R[cut], r[cut]
+    volume[cut] = math.pi*(R + r - d)**2*(d*d + 2*d*r - 3*r*r + 2*d*R + 6*r*R - 3*R*R)/(12*d)
+    return volume
+
+def analyze(pos, radius, L, periodic=False, r_max=None, bins=100, contact_tol=0.02, local_radius=None):
+    '''
+    Structure of one configuration of balls in a box of length L, with one pass over the
+    pairs of a CellList:
+      r, g               radial distribution function of the centers up to r_max
+                         (5 mean radii), with hard walls it is not corrected for the edges
+      contacts           number of balls of every ball closer than (1 + contact_tol) times
+                         the sum of their radii
+      overlaps           number of overlapping pairs, of balls with an overlap and the
+                         largest and mean depth in sums of radii
+      local_volume_frac  fraction of the sphere of radius local_radius (4 mean radii)
+                         around every ball filled by the balls, with hard walls the
+                         spheres of balls near a wall stick out of the box
+    In a periodic box r_max and local_radius are cut down to fit in half the box.
+    '''
+    pos = np.asarray(pos, dtype=float)
+    radius = np.asarray(radius, dtype=float)
+    N = len(pos)
+    mean_radius = radius.mean() if N else 0.0
+    r_max = r_max or 5*mean_radius
+    local_radius = local_radius or 4*mean_radius
+    if periodic:
+        # The minimum image only holds up to half the box
+        r_max = min(r_max, L/2)
+        local_radius = min(local_radius, L/2 - radius.max(initial=0))
+    edges = np.linspace(0, r_max, bins + 1)
+    hist = np.zeros(bins)
+    contacts = np.zeros(N, dtype=np.int64)
+    overlapping = np.zeros(N, dtype=bool)
+    n_overlaps = 0
+    depth_sum = 0.0
+    depth_max = 0.0
+    local = (4/3)*math.pi*np.minimum(radius, local_radius)**3          # Every ball fills its own sphere
+    cutoff = max(r_max, (1 + contact_tol)*2*radius.max(initial=0), local_radius + radius.max(initial=0))
+    for i, j, dist in pair_distances(pos, L, cutoff, periodic):
+        hist += np.histogram(dist, bins=edges)[0]
+        touch = radius[i] + radius[j]
+        close = dist <= (1 + contact_tol)*touch
+        contacts += np.bincount(i[close], minlength=N) + np.bincount(j[close], minlength=N)
+        depth = 1 - dist/touch
+        over = depth > 0
+        n_overlaps += int(over.sum())
+        if over.any():
+            depth_sum += float(depth[over].sum())
+            depth_max = max(depth_max, float(depth[over].max()))
+            overlapping[i[over]] = True
+            overlapping[j[over]] = True
+        local += np.bincount(i, lens_volume(dist, local_radius, radius[j]), minlength=N)
+        local += np.bincount(j, lens_volume(dist, local_radius, radius[i]), minlength=N)
+    shell = (4/3)*math.pi*(edges[1:]**3 - edges[:-1]**3)
+    density = N / L**3
+    g = 2*hist/(N*density*shell) if N else hist
+    return {
+        'N': N,
+        'volume_frac': packing_fraction(radius, L),
+        'r': (edges[1:] + edges[:-1])/2,
+        'g': g,
+        'contacts': contacts,
+        'overlaps': {'pairs': n_overlaps, 'balls': int(overlapping.sum()), 'max_depth': depth_max,
+                     'mean_depth': depth_sum/n_overlaps if n_overlaps else 0.0},
+        'local_volume_frac': local/((4/3)*math.pi*local_radius**3),
+    }
+
+def summary(result):
+    '''
+    Numbers of a result of analyze that fit in one JSON line
+    '''
+    contacts = result['contacts']
+    local = result['local_volume_frac']
+    return {
+        'N': result['N'],
+        'volume_frac': result['volume_frac'],
+        'mean_contacts': float(contacts.mean()) if len(contacts) else 0.0,
+        'contact_histogram': np.bincount(contacts).tolist(),
+        'overlaps': result['overlaps'],
+        'local_volume_frac_mean': float(local.mean()) if len(local) else 0.0,
+        'local_volume_frac_std': float(local.std()) if len(local) else 0.0,
+        'g_max': float(result['g'].max()) if len(result['g']) else 0.0,
+    }
+
+def analyze_trajectory(path, start=0, stop=None, every=1, **kwargs):
+    '''
+    analyze every frame of a trajectory written by TrajectoryWriter, yields (time, result)
+    Frames are read from the memory-mapped files one at a time. The default r_max and
+    local_radius come from the radii of the last frame, so every frame has the same bins.
+    '''
+    reader = TrajectoryReader(path)
+    if reader.frames:
+        mean_radius = float(np.mean(reader.radius[-1]))
+        kwargs['r_max'] = kwargs.get('r_max') or 5*mean_radius
+        kwargs['local_radius'] = kwargs.get('local_radius') or 4*mean_radius
+    for k in range(start, reader.frames if stop is None else min(stop, reader.frames), every):
+        yield float(reader.time[k]), analyze(np.array(reader.pos[k]), np.array(reader.radius[k]),
+                                             reader.L, reader.periodic, **kwargs)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Structure of saved packings of balls")
+    parser.add_argument("locations", nargs='?', default=None, help="File written by save_balls")
+    parser.add_argument("--trajectory", default=None, help="Analyze every frame of this trajectory directory")
+    parser.add_argument("--every", type=int, default=1, help="Frames between two analyzed frames")
+    parser.add_argument("--L", type=float, default=1, help="Length of the box of a locations file")
+    parser.add_argument("--periodic", action="store_true", help="The locations file is from a periodic box")
+    parser.add_argument("--r-max", type=float, default=None, help="Longest distance of g(r), 5 mean radii by default")
+    parser.add_argument("--bins", type=int, default=100, help="Bins of g(r)")
+    parser.add_argument("--contact-tol", type=float, default=0.02,
+                        help="Balls closer than (1 + tol) times the sum of their radii are in contact")
+    parser.add_argument("--local-radius", type=float, default=None,
+                        help="Radius of the sphere of the local volume fraction, 4 mean radii by default")
+    parser.add_argument("--rdf", default=None, help="Write g(r), averaged over the frames, to this file")
+    args = parser.parse_args(argv)
+    if (args.locations is None) == (args.trajectory is None):
+        parser.error("give either a locations file or --trajectory")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    kwargs = dict(r_max=args.r_max, bins=args.bins, contact_tol=args.contact_tol, local_radius=args.local_radius)
+    if args.trajectory:
+        frames = analyze_trajectory(args.trajectory, every=args.every, **kwargs)
+    else:
+        pos, radius = load_balls(args.locations, args.L if args.periodic else None)
+        frames = [(None, analyze(pos, radius, args.L, args.periodic, **kwargs))]
+    g = None
+    n = 0
+    for t, result in frames:
+        print(json.dumps(dict(t=t, **summary(result))))
+        g = result['g'] if g is None else g + result['g']
+        n += 1
+    if args.rdf and n:
+        np.savetxt(args.rdf, np.column_stack((result['r'], g/n)), delimiter=' , ', header='r , g')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+# Benchmarks of the physics kernels and of full headless steps
+# python benchmark.py --output bench.json                          run and save the results
+# python benchmark.py --output new.json --compare bench.json       also flag kernels that got slower
+
+import argparse
+import json
+import math
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+from utilities import *
+from vectorized import Calculate_tc_np, Calculate_tr_np, collision_wall_np, hard_collision_np, image_arrays
+from cell_list import Calculate_tc_cells
+from pair_cache import PairTimeCache
+from event_driven import EventScheduler
+from engine import Simulation
+from analysis import analyze
+
+def configuration(N, volume_frac, L=1, seed=0):
+    '''
+    Seeded random configuration of N balls filling volume_frac of the box
+    '''
+    rng = np.random.default_rng(seed)
+    radius = (3*volume_frac*L**3/(4*math.pi*N))**(1/3)
+    store = BallStore(N)
+    store.pos[:] = rng.uniform(0, L, (N,3))
+    store.vel[:] = rng.uniform(-0.1, 0.1, (N,3))
+    store.radius[:] = radius
+    return store
+
+def copy_store(store):
+    '''
+    Fresh copy of a configuration so every run of a kernel starts from the same state
+    '''
+    copy = BallStore(len(store))
+    copy.pos[:] = store.pos
+    copy.vel[:] = store.vel
+    copy.radius[:] = store.radius
+    copy.a[:] = store.a
+    return copy
+
+# Kernels as (name, largest N it is run for, function of (balls, N, L))
+kernels = [
+    ('Calculate_tc', 200, lambda balls, N, L: Calculate_tc(balls, N)),
+    ('Calculate_tc_periodic', 200, lambda balls, N, L: Calculate_tc(balls, N, L)),
+    ('Calculate_tc_np', 2000, lambda balls, N, L: Calculate_tc_np(balls, N)),
+    ('Calculate_tc_cells', 20000, lambda balls, N, L: Calculate_tc_cells(balls, N, L)),
+    ('Calculate_tc_cells_periodic', 20000, lambda balls, N, L: Calculate_tc_cells(balls, N, L, periodic=True)),
+    ('PairTimeCache_build', 20000, lambda balls, N, L: PairTimeCache(N, L, True).predict(balls, N, 0.0)),
+    ('Calculate_tr', 20000, lambda balls, N, L: Calculate_tr(balls, N, L)),
+    ('Calculate_tr_np', 20000, lambda balls, N, L: Calculate_tr_np(balls, N, L)),
+    ('generate_images', 20000, lambda balls, N, L: [generate_images(ball, L) for ball in balls]),
+    ('image_arrays', 20000, lambda balls, N, L: image_arrays(balls[0].store.pos, balls[0].store.radius, L)),
+    ('collision_wall', 20000, lambda balls, N, L: collision_wall(balls, L)),
+    ('hard_collision', 20000, lambda balls, N, L: hard_collision(balls, L)),
+    ('collision_wall_np', 20000, lambda balls, N, L: collision_wall_np(balls, L)),
+    ('hard_collision_np', 20000, lambda balls, N, L: hard_collision_np(balls, L)),
+    ('analyze_periodic', 20000, lambda balls, N, L: analyze(balls[0].store.pos, balls[0].store.radius, L, True)),
+]
+
+def measure(run, prepare, min_time=0.2, max_repeat=50):
+    '''
+    Time run(prepare()) until min_time has passed, prepare is not timed
+    Returns the best and the mean time of one run and the number of runs
+    '''
+    times = []
+    while len(times) < max_repeat and (sum(times) < min_time or len(times) < 3):
+        arg = prepare()
+        start = time.perf_counter()
+        run(arg)
+        times.append(time.perf_counter() - start)
+    return min(times), sum(times)/len(times), len(times)
+
+def peak_memory(run, prepare):
+    '''
+    Peak memory allocated by one run(prepare()), in bytes
+    '''
+    arg = prepare()
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    run(arg)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+def bench_kernels(N, volume_frac, L, seed, min_time):
+    results = []
+    store = configuration(N, volume_frac, L, seed)
+    for name, max_N, kernel in kernels:
+        if N > max_N:
+            continue
+        prepare = lambda: copy_store(store).balls()
+        run = lambda balls: kernel(balls, N, L)
+        best, mean, repeat = measure(run, prepare, min_time)
+        results.append({'name': name, 'N': N, 'volume_frac': volume_frac, 'seconds': best, 'mean_seconds': mean,
+                        'repeat': repeat, 'per_sec': 1/best, 'peak_bytes': peak_memory(run, prepare)})
+    return results
+
+def bench_steps(N, volume_frac, L, seed, steps, min_time, tc_method='cells', workers=None):
+    '''
+    Full headless steps of the engine, periodic box with the cell list or another tc_method
+    With workers the parallel method runs that many slab workers, they are started
+    before and stopped after the timed steps.
+    '''
+    radius = (3*volume_frac*L**3/(4*math.pi*N))**(1/3)
+    def prepare():
+        while sims:
+            sims.pop().close()                           # At most one set of workers at a time
+        sim = Simulation(N=N, L=L, initial_radius=radius, hardCollision=False, seed=seed, tc_method=tc_method,
+                         final_volume_frac=1, max_steps=steps, slab_workers=workers)
+        sims.append(sim)
+        return sim
+    sims = []
+    run = lambda sim: sim.run()
+    try:
+        best, mean, repeat = measure(run, prepare, min_time, max_repeat=5)
+        peak = peak_memory(run, prepare)
+    finally:
+        for sim in sims:
+            sim.close()
+    name = 'headless_step' if tc_method == 'cells' else 'headless_step_' + tc_method
+    if workers is not None:
+        name += '_{}'.format(workers)
+    return {'name': name, 'N': N, 'volume_frac': volume_frac, 'seconds': best/steps,
+            'mean_seconds': mean/steps, 'repeat': repeat, 'per_sec': steps/best, 'peak_bytes': peak}
+
+def bench_events(N, volume_frac, L, seed, events, min_time):
+    '''
+    Events of the event driven scheduler
+    '''
+    store = configuration(N, volume_frac, L, seed)
+    prepare = lambda: EventScheduler(store.pos, store.vel, store.radius, store.a, L, hard=False)
+    def run(scheduler):
+        for i in range(events):
+            scheduler.step()
+    best, mean, repeat = measure(run, prepare, min_time, max_repeat=5)
+    return {'name': 'event', 'N': N, 'volume_frac': volume_frac, 'seconds': best/events,
+            'mean_seconds': mean/events, 'repeat': repeat, 'per_sec': events/best, 'peak_bytes': peak_memory(run, prepare)}
+
+def compare(results, baseline, tolerance):
+    '''
+    Benchmarks that are more than tolerance slower than in the baseline
+    '''
+    old = {(r['name'], r['N'], r['volume_frac']): r for r in baseline['results']}
+    slower = []
+    for r in results:
+        b = old.get((r['name'], r['N'], r['volume_frac']))
+        if b is not None and r['seconds'] > b['seconds']*(1 + tolerance):
+            slower.append((r, b))
+    return slower
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks of the bouncing balls kernels")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[20, 200, 2000, 20000], help="Numbers of balls")
+    parser.add_argument("--fracs", type=float, nargs="+", default=[0.05, 0.3, 0.55, 0.7], help="Volume fractions")
+    parser.add_argument("--L", type=float, default=1, help="Length of the box")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the configurations")
+    parser.add_argument("--steps", type=int, default=20, help="Headless steps per run")
+    parser.add_argument("--workers", type=int, nargs="*", default=[1, 2, 4, 8],
+                        help="Slab workers of the parallel method, none to skip it")
+    parser.add_argument("--events", type=int, default=200, help="Events per run of the event driven scheduler")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Seconds each benchmark is repeated for")
+    parser.add_argument("--output", default="bench.json", help="Results file")
+    parser.add_argument("--compare", default=None, help="Baseline results file to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown against the baseline")
+    args = parser.parse_args(argv)
+
+    results = []
+    for N in args.sizes:
+        for volume_frac in args.fracs:
+            batch = bench_kernels(N, volume_frac, args.L, args.seed, args.min_time)
+            batch.append(bench_steps(N, volume_frac, args.L, args.seed, args.steps, args.min_time))
+            batch.append(bench_steps(N, volume_frac, args.L, args.seed, args.steps, args.min_time, 'cached'))
+            for workers in args.workers:
+                batch.append(bench_steps(N, volume_frac, args.L, args.seed, args.steps, args.min_time,
+                                         'parallel', workers))
+            if N <= 2000:
+                batch.append(bench_events(N, volume_frac, args.L, args.seed, args.events, args.min_time))
+            for r in batch:
+                print("{:30s} N={:<6d} frac={:<5} {:12.3e} s  {:12.1f} /s  {:10d} B".format(
+                    r['name'], N, volume_frac, r['seconds'], r['per_sec'], r['peak_bytes']))
+            results.extend(batch)
+
+    report = {
+        'meta': {'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+                 'platform': platform.platform(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'args': vars(args)},
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=1)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        slower = compare(results, baseline, args.tolerance)
+        for r, b in slower:
+            print("REGRESSION {} N={} frac={}: {:.3e} s, was {:.3e} s".format(
+                r['name'], r['N'], r['volume_frac'], r['seconds'], b['seconds']))
+        if slower:
+            sys.exit(1)
+        print("No regressions against", args.compare)
+
+if __name__ == "__main__":
+    main()
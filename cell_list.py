@@ -0,0 +1,118 @@
+import itertools
+import numpy as np
+from vectorized import balls_to_arrays, predict_pairs
+
+# Offsets of the 27 cells around (and including) a cell
+neighbor_offsets = np.array(list(itertools.product((-1,0,1), repeat=3)))
+# The cell itself and the 13 neighbors after it, the others are their negatives
+half_offsets = neighbor_offsets[13:]
+
+class CellList:
+    '''
+    Uniform grid over the box of length L with cells at least `cutoff` wide
+    Every pair of balls closer than cutoff is in the same or in adjacent cells
+    '''
+    def __init__(self, L, cutoff, periodic=False):
+        self.L = L                                               # Length of the box
+        self.periodic = periodic                                 # Wrap the grid around like collision_wall
+        self.n = max(1, int(L // cutoff)) if cutoff > 0 else 1   # Number of cells along each axis
+        self.size = L / self.n                                   # Width of a cell
+        self.order = None                                        # Ball indices sorted by cell
+        self.starts = None                                       # First entry of each cell in order
+        self.counts = None                                       # Number of balls in each cell
+        self.cells = None                                        # (x,y,z) cell of each ball
+
+    def build(self, pos):
+        '''
+        Put every ball in its cell, rebuild whenever the balls have moved
+        '''
+        n = self.n
+        cells = np.floor(pos / self.size).astype(np.int64)
+        if self.periodic:
+            cells %= n                                           # Balls outside the box belong to the wrapped cell
+        else:
+            np.clip(cells, 0, n-1, out=cells)                    # Balls touching a hard wall stay in the edge cell
+        flat = (cells[:,0]*n + cells[:,1])*n + cells[:,2]
+        self.order = np.argsort(flat, kind='stable')
+        self.counts = np.bincount(flat, minlength=n**3)
+        self.starts = np.concatenate(([0], np.cumsum(self.counts)[:-1]))
+        self.cells = cells
+        return self
+
+    def offset_pairs(self, offset):
+        '''
+        Every ball paired with every member of the cell at offset from its own cell
+        '''
+        n = self.n
+        nb = self.cells + offset
+        if self.periodic:
+            nb %= n
+            keep = np.arange(len(nb))
+        else:
+            inside = ((nb >= 0) & (nb < n)).all(axis=1)
+            keep = np.flatnonzero(inside)
+            nb = nb[inside]
+        flat = (nb[:,0]*n + nb[:,1])*n + nb[:,2]
+        count = self.counts[flat]
+        total = int(count.sum())
+        i = np.repeat(keep, count)
+        first = np.repeat(self.starts[flat] - (np.cumsum(count) - count), count)
+        j = self.order[first + np.arange(total)]
+        return i, j
+
+    def pairs(self):
+        '''
+        Candidate pairs (i, j) with i < j from the same or adjacent cells, sorted like
+        the double loop of Calculate_tc
+        '''
+        n = self.n
+        N = len(self.cells)
+        pi = []
+        pj = []
+        for offset in neighbor_offsets:
+            i, j = self.offset_pairs(offset)
+            if len(i) == 0:
+                continue
+            mask = i < j
+            pi.append(i[mask])
+            pj.append(j[mask])
+        if not pi:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        key = np.concatenate(pi) * N + np.concatenate(pj)
+        if self.periodic and n < 3:
+            key = np.unique(key)                                 # With fewer than 3 cells the offsets wrap onto the same cell
+        else:
+            key.sort()
+        return key // N, key % N
+
+    def half_pairs(self):
+        '''
+        Candidate pairs from the same or adjacent cells, unsorted, in one chunk per offset
+        of half_offsets so they never all have to be in memory at once. Every pair is in
+        exactly one chunk as long as a periodic grid has at least 3 cells along each axis.
+        '''
+        if self.periodic and self.n < 3:
+            raise ValueError("half_pairs needs at least 3 cells along each axis of a periodic box")
+        for offset in half_offsets:
+            i, j = self.offset_pairs(offset)
+            if not offset.any():
+                i, j = i[i < j], j[i < j]
+            yield i, j
+
+def Calculate_tc_cells(balls,N,L,periodic=False,max_dt=0.02,stats=None):
+    '''
+    Algorithm 4.2 restricted to balls in adjacent cells of a CellList
+    The cells are wide enough that every pair able to collide within max_dt is checked,
+    so min(tc, max_dt) is the same as with the full pair search. In periodic mode the
+    separations use the minimum image so pairs across the wrapped walls are found.
+    '''
+    if N < 2:
+        return float('inf'), []
+    pos, vel, radius, a = balls_to_arrays(balls[:N])
+    speed = np.sqrt(np.einsum('ij,ij->i', vel, vel)).max()
+    # Two balls closing in on each other and growing for max_dt, with some room for the
+    # velocity changes made while resolving overlaps
+    cutoff = 2*radius.max() + 2*max_dt*(speed + np.abs(a).max())*1.5
+    cells = CellList(L, cutoff, periodic).build(pos)
+    i, j = cells.pairs()
+    return predict_pairs(balls, pos, vel, radius, a, i, j, L if periodic else None, stats)
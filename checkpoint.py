@@ -0,0 +1,21 @@
+import os
+import pickle
+
+def save_checkpoint(state, path):
+    '''
+    Write the state of a simulation to path
+    The file is replaced in one step so an interrupted save keeps the previous checkpoint
+    '''
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def load_checkpoint(path):
+    '''
+    Read a state written by save_checkpoint
+    '''
+    with open(path, 'rb') as f:
+        return pickle.load(f)
@@ -0,0 +1,460 @@
+# Simulation engine without any rendering, run this file for a headless simulation
+
+import argparse
+import copy
+import random
+import numpy as np
+from utilities import *
+from vectorized import Calculate_tc_np, Calculate_tr_np, arrays_to_balls, collision_wall_np, hard_collision_np, minimum_image
+from cell_list import Calculate_tc_cells
+from pair_cache import PairTimeCache
+from event_driven import EventScheduler
+from trajectory import TrajectoryWriter
+from checkpoint import save_checkpoint, load_checkpoint
+from profiling import Profiler, NullProfiler
+from step_control import StepController
+from parallel import SharedBallStore, SlabPool
+from initial import initial_configuration, radius_for_volume_frac
+from jamming import JammingMonitor, packing_fraction
+
+def save_balls(balls, path='locations.txt', L=None):
+    '''
+    Save balls location in a locations.txt file
+    If L is given the periodic images of the balls are written after each ball
+    Every row is "radius , x , y , z , image" where image is 1 for a periodic image, else 0
+    '''
+    rows = []
+    for ball in balls:
+        pos = ball.pos
+        rows.append("{} , {} , {} , {} , 0\n".format(ball.radius, pos.x, pos.y, pos.z))
+        if L is None:
+            continue
+        for img in image_positions(ball,L):
+            rows.append("{} , {} , {} , {} , 1\n".format(ball.radius, img.x, img.y, img.z))
+    with open(path,'w') as f:
+        f.writelines(rows)
+    return
+
+class Simulation:
+    '''
+    State and time stepping of the bouncing balls, independent of the viewer
+    '''
+    def __init__(self, N=20, L=1, initial_radius=0.1, final_volume_frac=0.7, hardCollision=True,
+                 increase_radius_hard=False, seed=None, tc_method='scalar', eventDriven=False,
+                 frame_time=0.02, max_steps=None, trajectory=None, snapshot_interval=1,
+                 checkpoint=None, checkpoint_interval=1000, profile=None, profile_interval=100,
+                 adaptive_dt=False, dt_min=1e-4, dt_max=0.5, overlap_tol=0.5, slab_workers=None,
+                 init_method='uniform', initial_volume_frac=None, jam_window=10, jam_pressure=None,
+                 jam_collision_rate=None, jam_min_growth=None, max_events=None, state=None):
+        # Arguments needed to build this simulation again from a checkpoint
+        self.config = dict(N=N, L=L, initial_radius=initial_radius, final_volume_frac=final_volume_frac,
+                           hardCollision=hardCollision, increase_radius_hard=increase_radius_hard, seed=seed,
+                           tc_method=tc_method, eventDriven=eventDriven, frame_time=frame_time,
+                           max_steps=max_steps, trajectory=trajectory, snapshot_interval=snapshot_interval,
+                           checkpoint=checkpoint, checkpoint_interval=checkpoint_interval,
+                           profile=profile, profile_interval=profile_interval, adaptive_dt=adaptive_dt,
+                           dt_min=dt_min, dt_max=dt_max, overlap_tol=overlap_tol, slab_workers=slab_workers,
+                           init_method=init_method, initial_volume_frac=initial_volume_frac,
+                           jam_window=jam_window, jam_pressure=jam_pressure,
+                           jam_collision_rate=jam_collision_rate, jam_min_growth=jam_min_growth,
+                           max_events=max_events)
+        self.N = N                                        # Number of balls
+        self.L = L                                        # Length of the box
+        self.final_volume_frac = final_volume_frac        # Fraction of the volume of the box at end
+        self.hardCollision = hardCollision                # Hard boundaries, else periodic box
+        self.increase_radius_hard = increase_radius_hard  # Increase the radius for the hard collision
+        self.eventDriven = eventDriven                    # Use the event driven scheduler
+        self.frame_time = frame_time                      # Simulation time per step of the event driven mode
+        self.max_events = max_events                      # Most events in one step of the event driven mode
+        self.max_steps = max_steps                        # Stop after this many steps
+        self.checkpoint = checkpoint                      # File the state is saved to
+        self.checkpoint_interval = checkpoint_interval    # Steps between two checkpoints
+        self.rng = random.Random(seed)                    # Random numbers of this simulation
+        self.t = 0.0                                      # Simulation time
+        self.steps = 0                                    # Number of steps done
+        self.collisions = 0                               # Number of ball-ball collisions
+        self.wall_collisions = 0                          # Number of reflections from the walls
+        self.last_tc = None                               # Time of collision of the last step
+        self.last_del_t = None                            # Time step of the last step
+        # Collision rate, pressure and packing fraction, stops the run once it is jammed
+        self.jamming = JammingMonitor(jam_window, jam_pressure, jam_collision_rate, jam_min_growth)
+        # Wall time per phase, only recorded if a profile file is given
+        self.profiler = NullProfiler() if profile is None else Profiler(profile, profile_interval)
+        # Arrays holding the state of the balls, shared with the workers of the parallel method
+        self.store = SharedBallStore(N) if tc_method == 'parallel' else BallStore(N)
+        self.slab_pool = None
+        # Algorithm used for the time of collision, the periodic box uses the minimum image
+        box = None if hardCollision else L
+        stats = self.stats = {'overlap_corrections': 0, 'skipped_passes': 0, 'virial': 0.0}   # Counters filled in by the collision algorithms
+        if tc_method == 'scalar':
+            self.tc = lambda balls, N: Calculate_tc(balls, N, box, stats)
+        elif tc_method == 'numpy':
+            self.tc = lambda balls, N: Calculate_tc_np(balls, N, box, stats)
+        elif tc_method == 'cells':
+            self.tc = lambda balls, N: Calculate_tc_cells(balls, N, L, periodic=not hardCollision, stats=stats)
+        elif tc_method == 'cached':
+            # Without growth the hard walls mode keeps the radii fixed, predict with that
+            self.pair_cache = PairTimeCache(N, L, not hardCollision, np.zeros(N) if hardCollision and not increase_radius_hard else None)
+            self.tc = lambda balls, N: self.pair_cache.predict(balls, N, self.t, stats)
+        elif tc_method == 'parallel':
+            # One worker process per slab of the box, all cores by default
+            self.slab_pool = SlabPool(self.store, L, not hardCollision, slab_workers)
+            self.tc = lambda balls, N: self.slab_pool.predict(balls, N, stats)
+        else:
+            raise ValueError("Unknown tc_method " + repr(tc_method))
+
+        # Time step of the hard walls mode from the earliest contact, else a fixed 0.05
+        self.step_control = StepController(L, dt_min, dt_max, overlap_tol) if adaptive_dt else None
+
+        self.scheduler = None
+        if initial_volume_frac is not None:
+            initial_radius = radius_for_volume_frac(N, L, initial_volume_frac)
+        if state is not None:
+            self.restore(state)
+        else:
+            if init_method != 'uniform':
+                # Balls that do not overlap from random sequential addition or a jittered lattice
+                self.store.pos[:], self.store.vel[:] = initial_configuration(N, L, initial_radius, seed, init_method,
+                                                                             periodic=not hardCollision)
+            else:
+                # Initialize the balls with random positions and velocities
+                for i in range(N):
+                    # Initialize the ball coordinates randomly
+                    rand_x = self.rng.uniform(0.1,0.9)
+                    rand_y = self.rng.uniform(0.1,0.9)
+                    rand_z = self.rng.uniform(0.1,0.9)
+                    # Initialize the ball velocities randomly
+                    rand_x_vel = self.rng.uniform(-0.1,0.1)
+                    rand_y_vel = self.rng.uniform(-0.1,0.1)
+                    rand_z_vel = self.rng.uniform(-0.1,0.1)
+                    self.store.pos[i] = (rand_x,rand_y,rand_z)
+                    self.store.vel[i] = (rand_x_vel,rand_y_vel,rand_z_vel)
+            self.store.radius[:] = initial_radius
+
+            if eventDriven:
+                # Event calendar of ball-ball and ball-wall events (hard walls or periodic box)
+                a = self.store.a
+                if hardCollision and not increase_radius_hard:
+                    a = np.zeros(N)
+                self.scheduler = EventScheduler(self.store.pos, self.store.vel, self.store.radius, a, L, hardCollision)
+        self.balls = self.store.balls()                                     # List of balls
+
+        self.trajectory = None
+        if trajectory is not None:
+            # Binary snapshots of the balls every snapshot_interval steps
+            # Only a resumed run continues an existing trajectory
+            self.trajectory = TrajectoryWriter(trajectory, N, L, not hardCollision, snapshot_interval,
+                                               append=state is not None)
+            if state is None:
+                self.snapshot()
+            else:
+                self.trajectory.truncate(state['frames'])       # Frames written after the checkpoint are written again
+
+    def step(self):
+        '''
+        Advance the simulation by one step, returns the time step taken
+        '''
+        balls = self.balls
+        N = self.N
+        L = self.L
+        phase = self.profiler.phase
+        tc = None
+        if self.eventDriven:
+            with phase('events'):
+                # Process all events until the next frame
+                self.scheduler.run_until(self.scheduler.t + self.frame_time, self.max_events)
+                arrays_to_balls(balls, *self.scheduler.sync())
+            self.collisions = self.scheduler.n_collisions
+            self.wall_collisions = self.scheduler.n_walls
+            self.stats['virial'] = self.scheduler.virial
+            del_t = self.scheduler.t - self.t
+
+        elif not self.hardCollision:                            # If the simulation is not hard collision
+            with phase('collision_prediction'):
+                tc, particles1 = self.tc(balls,N)               # Calculate the time of collision (Algorithm 4.2)
+            with phase('wall_prediction'):
+                tr, particles2 = Calculate_tr_np(balls,N,L)     # Calculate the time of reflection (Algorithm 4.3)
+            del_t = min(tc,0.02)                                # If collision occurs, take the minimum of the two
+            # Update the position and radius of the balls
+            with phase('position_update'):
+                self.store.update(del_t)
+                self.store.update_radius(del_t)
+            # Change the position of Balls
+            if del_t == tc:
+                self.collisions += 1
+                with phase('collision_resolution'):
+                    vel_i,vel_j = collosion_balls(particles1)   # Calculate the velocities of the balls after collision
+                    r = minimum_image(self.store.pos[particles1[0].index] - self.store.pos[particles1[1].index], L)
+                    self.stats['virial'] += float(np.dot(r, (vel_i.x, vel_i.y, vel_i.z) - self.store.vel[particles1[0].index]))
+                    # Update the velocities of the balls
+                    particles1[0].vel = vel_i
+                    particles1[1].vel = vel_j
+            # Change the position of Balls
+            with phase('wall_update'):
+                collision_wall_np(balls,L)
+
+        else:
+            with phase('wall_update'):
+                self.wall_collisions += hard_collision_np(balls,L) # If the simulation is hard collision
+            if self.step_control is None:
+                del_t = 0.05
+                with phase('collision_prediction'):
+                    self.tc(balls,N)
+            else:
+                store = self.store
+                a = store.a if self.increase_radius_hard else np.zeros(N)
+                with phase('step_control'):
+                    i, j, touching = self.step_control.near_pairs(store.pos, store.vel, store.radius, a)
+                with phase('collision_prediction'):
+                    if touching.any():
+                        self.tc(balls,N)                # Resolve the overlaps
+                    else:
+                        self.stats['skipped_passes'] += 1   # Nothing to resolve, no pair touches
+                if touching.any():
+                    # The corrections can speed balls up, look for the near pairs again
+                    with phase('step_control'):
+                        i, j, _ = self.step_control.near_pairs(store.pos, store.vel, store.radius, a)
+                with phase('step_control'):
+                    del_t, tc = self.step_control.step(store.pos, store.vel, store.radius, a, i, j)
+            with phase('position_update'):
+                self.store.update(del_t)                        # Update the position of the balls
+                if self.increase_radius_hard:                   # If the radius of the balls needs to be increased
+                    self.store.update_radius(del_t)
+
+        self.last_tc = tc
+        self.last_del_t = del_t
+        self.t += del_t
+        self.steps += 1
+        self.jamming.update(self, del_t)
+        if self.trajectory is not None:
+            self.snapshot()
+        if self.checkpoint is not None and self.steps % self.checkpoint_interval == 0:
+            self.save_checkpoint()
+        self.profiler.end_step(self)
+        return del_t
+
+    def snapshot(self):
+        '''
+        Write the current state to the trajectory if this step is due
+        '''
+        self.trajectory.record(self.steps, self.t, self.store.pos, self.store.vel, self.store.radius)
+
+    def state(self):
+        '''
+        Everything needed to continue this simulation exactly where it is
+        '''
+        if self.trajectory is not None:
+            self.trajectory.flush()
+        return {
+            'config': self.config,
+            't': self.t,
+            'steps': self.steps,
+            'collisions': self.collisions,
+            'wall_collisions': self.wall_collisions,
+            'stats': dict(self.stats),
+            'rng': self.rng.getstate(),
+            'pos': self.store.pos.copy(),
+            'vel': self.store.vel.copy(),
+            'radius': self.store.radius.copy(),
+            'a': self.store.a.copy(),
+            'scheduler': copy.deepcopy(self.scheduler),
+            'pair_cache': copy.deepcopy(getattr(self, 'pair_cache', None)),
+            'jamming': copy.deepcopy(self.jamming),
+            'frames': None if self.trajectory is None else self.trajectory.frames,
+        }
+
+    def restore(self, state):
+        '''
+        Put the simulation back into a state returned by state()
+        '''
+        self.t = state['t']
+        self.steps = state['steps']
+        self.collisions = state['collisions']
+        self.wall_collisions = state['wall_collisions']
+        self.stats.update(state['stats'])
+        self.rng.setstate(state['rng'])
+        self.store.pos[:] = state['pos']
+        self.store.vel[:] = state['vel']
+        self.store.radius[:] = state['radius']
+        self.store.a[:] = state['a']
+        self.scheduler = state['scheduler']
+        if state.get('pair_cache') is not None:
+            self.pair_cache = state['pair_cache']
+        if state.get('jamming') is not None:
+            self.jamming = state['jamming']
+
+    def save_checkpoint(self, path=None):
+        '''
+        Save the state to the checkpoint file
+        '''
+        save_checkpoint(self.state(), path or self.checkpoint)
+
+    @classmethod
+    def resume(cls, path, **overrides):
+        '''
+        Simulation continuing from a checkpoint file, overrides change its settings
+        '''
+        state = load_checkpoint(path)
+        config = dict(state['config'], **overrides)
+        return cls(state=state, **config)
+
+    def close(self):
+        '''
+        Close the trajectory and profile files and stop the workers of the parallel method
+        '''
+        if self.trajectory is not None:
+            self.trajectory.close()
+        self.profiler.close()
+        if self.slab_pool is not None:
+            self.slab_pool.close()
+            self.slab_pool = None
+            self.store.close()
+
+    def volume_fraction(self):
+        '''
+        Volume fraction of the box
+        '''
+        return packing_fraction(self.store.radius, self.L)
+
+    @property
+    def done(self):
+        '''
+        Condition for stopping the Simulation
+        '''
+        if self.max_steps is not None and self.steps >= self.max_steps:
+            return True
+        if self.jamming.jammed():
+            return True
+        return self.volume_fraction() > self.final_volume_frac
+
+    @property
+    def image_L(self):
+        '''
+        Length of the periodic box for drawing and saving images, None with hard walls
+        '''
+        return None if self.hardCollision else self.L
+
+    def run(self):
+        '''
+        Step until the simulation is done
+        '''
+        while not self.done:
+            self.step()
+        return self
+
+def add_simulation_args(parser):
+    '''
+    Command line options of a Simulation
+    '''
+    parser.add_argument("--N", type=int, default=20, help="Number of balls")
+    parser.add_argument("--L", type=float, default=1, help="Length of the box")
+    parser.add_argument("--initial-radius", type=float, default=0.1, help="Initial radius of the balls")
+    parser.add_argument("--final-volume-frac", type=float, default=0.7, help="Fraction of the volume of the box at end")
+    parser.add_argument("--initial-volume-frac", type=float, default=None,
+                        help="Fraction of the volume of the box at start, sets the initial radius")
+    parser.add_argument("--init", choices=("uniform","rsa","lattice"), default="uniform",
+                        help="Initial positions: uniform may overlap, rsa (random sequential addition, up to "
+                             "about 0.33 periodic or 0.25 with hard walls) and lattice (jittered fcc sized to N, "
+                             "about 0.69 periodic or 0.63 with hard walls for 1000 balls) do not")
+    parser.add_argument("--hard-collision", action=argparse.BooleanOptionalAction, default=True,
+                        help="Hard boundaries and collisions, else periodic box")
+    parser.add_argument("--increase-radius-hard", action="store_true", help="Increase the radius for the hard collision")
+    parser.add_argument("--tc-method", choices=("scalar","numpy","cells","cached","parallel"), default="scalar",
+                        help="Algorithm for the time of collision")
+    parser.add_argument("--event-driven", action="store_true", help="Use the event driven scheduler")
+    parser.add_argument("--max-steps", type=int, default=None, help="Stop after this many steps")
+    parser.add_argument("--slab-workers", type=int, default=None,
+                        help="Worker processes of the parallel tc method, all cores by default")
+    parser.add_argument("--adaptive-dt", action="store_true", help="Time step of the hard collision mode from the earliest contact")
+    parser.add_argument("--dt-min", type=float, default=1e-4, help="Smallest adaptive time step")
+    parser.add_argument("--dt-max", type=float, default=0.5, help="Largest adaptive time step")
+    parser.add_argument("--overlap-tol", type=float, default=0.5,
+                        help="Deepest overlap or wall overshoot in one adaptive step, in smallest radii, in (0, 1]")
+    parser.add_argument("--jam-window", type=float, default=10,
+                        help="Collisions per ball the jamming estimates are taken over")
+    parser.add_argument("--jam-pressure", type=float, default=None,
+                        help="Stop once the reduced pressure PV/NkT is above this")
+    parser.add_argument("--jam-collision-rate", type=float, default=None,
+                        help="Stop once the collisions per ball and unit time are above this")
+    parser.add_argument("--jam-min-growth", type=float, default=None,
+                        help="Stop once the volume fraction grew less than this over the window")
+    parser.add_argument("--max-events", type=int, default=None,
+                        help="Most events in one step of the event driven mode, so a jammed run keeps stepping")
+
+def check_simulation_args(parser, args):
+    '''
+    Usage error for options of add_simulation_args that are out of range or whose run
+    would never end
+    With hard walls the balls only grow with --increase-radius-hard, without it a run
+    that starts below --final-volume-frac needs --max-steps to stop.
+    '''
+    if not 0 < args.overlap_tol <= 1:
+        parser.error("--overlap-tol must be in (0, 1], not {}".format(args.overlap_tol))
+    if getattr(args, 'resume', None) or args.max_steps is not None:
+        return
+    if args.hard_collision and not args.increase_radius_hard:
+        radius = args.initial_radius
+        if args.initial_volume_frac is not None:
+            radius = radius_for_volume_frac(args.N, args.L, args.initial_volume_frac)
+        if packing_fraction(np.full(args.N, radius), args.L) <= args.final_volume_frac:
+            parser.error("with hard walls the balls only grow with --increase-radius-hard, so this run never "
+                         "reaches --final-volume-frac; add --increase-radius-hard, --no-hard-collision or --max-steps")
+
+def simulation_kwargs(args):
+    '''
+    Simulation arguments from the options of add_simulation_args
+    '''
+    return dict(N=args.N, L=args.L, initial_radius=args.initial_radius,
+                final_volume_frac=args.final_volume_frac, hardCollision=args.hard_collision,
+                increase_radius_hard=args.increase_radius_hard, tc_method=args.tc_method,
+                eventDriven=args.event_driven, max_steps=args.max_steps, adaptive_dt=args.adaptive_dt,
+                dt_min=args.dt_min, dt_max=args.dt_max, overlap_tol=args.overlap_tol,
+                slab_workers=args.slab_workers, init_method=args.init,
+                initial_volume_frac=args.initial_volume_frac, jam_window=args.jam_window,
+                jam_pressure=args.jam_pressure, jam_collision_rate=args.jam_collision_rate,
+                jam_min_growth=args.jam_min_growth, max_events=args.max_events)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Headless bouncing balls simulation")
+    add_simulation_args(parser)
+    parser.add_argument("--seed", type=int, default=None, help="Seed of the random initial configuration")
+    parser.add_argument("--trajectory", default=None, help="Write binary snapshots to this new or empty directory")
+    parser.add_argument("--snapshot-interval", type=int, default=1, help="Steps between two snapshots")
+    parser.add_argument("--checkpoint", default=None, help="Save the state to this file every checkpoint interval")
+    parser.add_argument("--checkpoint-interval", type=int, default=1000, help="Steps between two checkpoints")
+    parser.add_argument("--resume", default=None, help="Continue from this checkpoint, its settings are used")
+    parser.add_argument("--profile", default=None, help="Append per-phase timings and counters as JSON lines to this file")
+    parser.add_argument("--profile-interval", type=int, default=100, help="Steps between two profile lines")
+    parser.add_argument("--save", default=None, help="Save the final locations of the balls to this file")
+    args = parser.parse_args(argv)
+    check_simulation_args(parser, args)
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.resume:
+        overrides = {}
+        if args.max_steps is not None:
+            overrides['max_steps'] = args.max_steps
+        if args.checkpoint is not None:
+            overrides['checkpoint'] = args.checkpoint
+            overrides['checkpoint_interval'] = args.checkpoint_interval
+        if args.profile is not None:
+            overrides['profile'] = args.profile
+            overrides['profile_interval'] = args.profile_interval
+        sim = Simulation.resume(args.resume, **overrides)
+    else:
+        sim = Simulation(seed=args.seed, trajectory=args.trajectory, snapshot_interval=args.snapshot_interval,
+                         checkpoint=args.checkpoint, checkpoint_interval=args.checkpoint_interval,
+                         profile=args.profile, profile_interval=args.profile_interval,
+                         **simulation_kwargs(args))
+    sim.run()
+    sim.close()
+    print("Program ended after {} steps, t = {}, volume fraction = {}".format(sim.steps, sim.t, sim.volume_fraction()))
+    if sim.jamming.reason is not None:
+        print("Jammed ({}): {}".format(sim.jamming.reason, sim.jamming.estimates()))
+    if args.save:
+        save_balls(sim.balls, args.save, sim.image_L)
+
+if __name__ == "__main__":
+    main()
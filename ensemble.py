@@ -0,0 +1,69 @@
+# Many independent simulations with different seeds, one process per run
+
+import argparse
+import csv
+import time
+from concurrent.futures import ProcessPoolExecutor
+from engine import Simulation, add_simulation_args, check_simulation_args, simulation_kwargs
+
+# Columns of the results file
+result_fields = ('seed', 'N', 'volume_frac', 'reached', 'jammed', 'pressure', 'time', 'steps', 'collisions', 'wall_collisions',
+                 'overlap_corrections', 'wall_clock')
+
+def run_one(config):
+    '''
+    Run one simulation to the end and summarize it
+    '''
+    start = time.perf_counter()
+    sim = Simulation(**config).run()
+    sim.close()
+    volume_frac = sim.volume_fraction()
+    return {
+        'seed': config.get('seed'),
+        'N': sim.N,
+        'volume_frac': volume_frac,                         # Volume fraction reached
+        'reached': volume_frac > sim.final_volume_frac,     # False if stopped by max_steps
+        'jammed': sim.jamming.reason,                       # Criterion that stopped a jammed run
+        'pressure': sim.jamming.pressure,                   # Reduced pressure at the end
+        'time': sim.t,                                      # Simulation time to get there
+        'steps': sim.steps,
+        'collisions': sim.collisions,
+        'wall_collisions': sim.wall_collisions,
+        'overlap_corrections': sim.stats['overlap_corrections'],
+        'wall_clock': time.perf_counter() - start,
+    }
+
+def run_ensemble(configs, workers=None):
+    '''
+    Run the simulations of configs in a process pool, results are in the order of configs
+    '''
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(run_one, configs))
+
+def save_results(results, path):
+    '''
+    Save one row per run in a csv file
+    '''
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=result_fields)
+        writer.writeheader()
+        writer.writerows(results)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ensemble of independent bouncing balls simulations")
+    add_simulation_args(parser)
+    parser.add_argument("--runs", type=int, default=8, help="Number of simulations")
+    parser.add_argument("--first-seed", type=int, default=0, help="Seed of the first run, the others follow")
+    parser.add_argument("--workers", type=int, default=None, help="Number of processes, all cores by default")
+    parser.add_argument("--output", default="ensemble.csv", help="Results file")
+    args = parser.parse_args(argv)
+    check_simulation_args(parser, args)
+    kwargs = simulation_kwargs(args)
+    configs = [dict(kwargs, seed=args.first_seed + i) for i in range(args.runs)]
+    results = run_ensemble(configs, args.workers)
+    save_results(results, args.output)
+    reached = sum(r['reached'] for r in results)
+    print("{} runs, {} reached the volume fraction, results in {}".format(len(results), reached, args.output))
+
+if __name__ == "__main__":
+    main()
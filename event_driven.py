@@ -0,0 +1,357 @@
+import heapq
+import numpy as np
+from vectorized import minimum_image
+from cell_list import CellList
+
+# Event code of a ball whose nearest periodic images have to be looked at again
+recheck = -7
+# Event code of a ball that used up its share of the neighbour list skin
+rebuild = -8
+
+class EventScheduler:
+    '''
+    Lubachevsky-Stillinger event driven simulation of growing balls
+    Predicted ball-ball and ball-wall events are kept in a heap. Every ball has a
+    collision counter, an event is stale as soon as the counter of one of its balls
+    changed. Balls are only moved to the current time when an event touches them.
+    Collision partners come from neighbour lists built with a CellList of cutoff
+    2*rmax + skin, so an event costs O(neighbours) instead of O(N). A pair left out of
+    the lists is at least skin apart, it cannot touch before one of its balls moved and
+    grew by skin/2, and that is when the ball gets a rebuild event.
+    A periodic box with fewer than 3 cells along each axis has no lists, every ball is
+    a candidate partner. A pair time then only holds while the images used stay the
+    nearest, so every ball also gets a recheck event when another image could come
+    into reach.
+    '''
+    def __init__(self, pos, vel, radius, a, L=1, hard=True, t=0.0, skin=None):
+        self.pos = np.array(pos, dtype=float)            # Positions at the time t_ball
+        self.vel = np.array(vel, dtype=float)            # Velocities
+        self.radius = np.array(radius, dtype=float)      # Radii at the time t_ball
+        self.a = np.array(a, dtype=float)                # Rate of change of radius
+        self.L = L                                       # Length of the box
+        self.hard = hard                                 # Reflecting walls, else periodic box
+        self.t = t                                       # Simulation time
+        N = len(self.radius)
+        self.t_ball = np.full(N, t)                      # Time each ball was last moved to
+        self.counts = np.zeros(N, dtype=np.int64)        # Collision counter of each ball
+        self.partner = np.full(N, -1, dtype=np.int64)    # Ball the next event of each ball is with
+        self.waiting = [set() for i in range(N)]         # Balls whose next event is with this ball
+        self.events = []                                 # Heap of (time, seq, i, j, count_i, count_j)
+        self.seq = 0
+        self.n_collisions = 0                            # Number of ball-ball events
+        self.n_walls = 0                                 # Number of ball-wall events
+        self.virial = 0.0                                # Sum of r_ij . dv_i over the ball-ball events
+        self.skin = skin                                 # Margin of the neighbour lists, the largest radius if None
+        self.n_rebuilds = 0                              # Number of neighbour list rebuilds
+        self.build()
+        self.predict_all()
+
+    def positions(self, t=None):
+        '''
+        Positions and radii of all balls at time t without moving them
+        '''
+        t = self.t if t is None else t
+        dt = t - self.t_ball
+        pos = self.pos + self.vel*dt[:,None]
+        if not self.hard:
+            pos %= self.L
+        return pos, self.radius + self.a*dt
+
+    def advance(self, i):
+        '''
+        Move ball i to the current simulation time
+        '''
+        dt = self.t - self.t_ball[i]
+        self.pos[i] += self.vel[i]*dt
+        if not self.hard:
+            self.pos[i] %= self.L
+        self.radius[i] += self.a[i]*dt
+        self.t_ball[i] = self.t
+
+    def sync(self):
+        '''
+        Move all balls to the current simulation time and return the state arrays
+        '''
+        self.pos, self.radius = self.positions()
+        self.t_ball[:] = self.t
+        return self.pos, self.vel, self.radius
+
+    def build(self):
+        '''
+        Neighbour lists of all balls, the balls must be up to date
+        Pairs closer than skin (surface to surface) are listed, as start/flat arrays in
+        the layout of a sparse row matrix.
+        '''
+        N = len(self.radius)
+        rmax = float(self.radius.max()) if N else 0.0
+        self.margin = rmax if self.skin is None else self.skin
+        cells = CellList(self.L, 2*rmax + self.margin, not self.hard) if self.margin > 0 else None
+        if cells is None or (not self.hard and cells.n < 3):
+            self.start = None                            # Every ball is a candidate partner
+            return
+        i, j = cells.build(self.pos).pairs()
+        r = self.pos[i] - self.pos[j]
+        if not self.hard:
+            r = minimum_image(r, self.L)
+        close = np.sqrt(np.einsum('ij,ij->i', r, r)) - self.radius[i] - self.radius[j] < self.margin
+        i, j = i[close], j[close]
+        lo = np.concatenate((i, j))
+        hi = np.concatenate((j, i))
+        order = np.lexsort((hi, lo))                     # Rows in ascending order break ties like a scan of all balls
+        self.flat = hi[order]
+        self.start = np.concatenate(([0], np.cumsum(np.bincount(lo, minlength=N))))
+        self.pos0 = self.pos.copy()                      # Positions and radii the lists were built with
+        self.radius0 = self.radius.copy()
+
+    def neighbours(self, i):
+        '''
+        Candidate collision partners of ball i
+        '''
+        if self.start is None:
+            return np.flatnonzero(np.arange(len(self.radius)) != i)
+        return self.flat[self.start[i]:self.start[i+1]]
+
+    def separations(self, i, k):
+        '''
+        Separation r, relative velocity v, sum of the radii R and of the growth rates A
+        of ball i and the balls k now, ball i must be up to date
+        '''
+        dt = self.t - self.t_ball[k]
+        r = self.pos[i] - (self.pos[k] + self.vel[k]*dt[:,None])
+        if not self.hard:
+            r = minimum_image(r, self.L)
+        return r, self.vel[i] - self.vel[k], self.radius[i] + self.radius[k] + self.a[k]*dt, self.a[i] + self.a[k]
+
+    def pair_times(self, i, k):
+        '''
+        Collision times from now of the pairs (i, k), inf if they never touch
+        The balls i must be up to date. Solves |r + v t| = R + A t for every pair.
+        '''
+        r, v, R, A = self.separations(i, k)
+        rv = np.einsum('ij,ij->i', r, v)
+        rr = np.einsum('ij,ij->i', r, r)
+        qa = np.einsum('ij,ij->i', v, v) - A**2
+        qb = rv - A*R
+        qc = rr - R**2
+        disc = qb**2 - qa*qc
+        apart = qc > 0
+        ok = apart & (((qb < 0) & (disc >= 0)) | (qa < 0))
+        # Overlapping balls collide right away unless they already separate faster than they grow
+        now = ~apart & (rv < A*np.sqrt(rr))
+        # Stable form of (-b - sqrt(b^2 - ac))/a
+        tc = np.full(len(qa), np.inf)
+        tc[ok] = qc[ok]/(np.sqrt(np.maximum(disc[ok], 0)) - qb[ok])
+        tc[now] = 0.0
+        return tc
+
+    def pair_time(self, i):
+        '''
+        Earliest collision of ball i with one of its neighbours, as (time from now, partner)
+        Ball i must be up to date.
+        '''
+        k = self.neighbours(i)
+        if len(k) == 0:
+            return float('inf'), -1
+        tc = self.pair_times(i, k)
+        m = int(np.argmin(tc))
+        if tc[m] == np.inf:
+            return float('inf'), -1
+        return float(tc[m]), int(k[m])
+
+    def image_time(self, i):
+        '''
+        Time from now until another periodic image of some ball could touch ball i
+        The other images are at least L - |r_k| away along every axis k.
+        '''
+        r, v, R, A = self.separations(i, self.neighbours(i))
+        gap = self.L - np.abs(r) - R[:,None]
+        speed = np.abs(v) + A[:,None]
+        with np.errstate(divide='ignore'):
+            image = np.where(speed > 0, np.maximum(gap, 0)/speed, np.inf)
+        return float(image.min()) if len(image) else float('inf')
+
+    def skin_time(self, i):
+        '''
+        Time from now until ball i could have moved and grown by skin/2 since the
+        neighbour lists were built, ball i must be up to date
+        '''
+        d = self.pos[i] - self.pos0[i]
+        if not self.hard:
+            d = minimum_image(d, self.L)
+        left = self.margin/2 - np.sqrt(d.dot(d)) - (self.radius[i] - self.radius0[i])
+        speed = np.sqrt(self.vel[i].dot(self.vel[i])) + self.a[i]
+        return float(max(left, 0.0)/speed) if speed > 0 else float('inf')
+
+    def wall_time(self, i):
+        '''
+        Earliest wall contact of ball i, as (time from now, wall code)
+        Wall code -1-2*axis for the lower wall and -2-2*axis for the upper wall. In a
+        periodic box with neighbour lists there are no walls, without lists the recheck
+        of the nearest images.
+        '''
+        if not self.hard:
+            if self.start is None:
+                return self.image_time(i), recheck
+            return float('inf'), 0
+        tr = float('inf')
+        wall = 0
+        a = self.a[i]
+        r = self.radius[i]
+        for axis in range(3):
+            x = self.pos[i, axis]
+            v = self.vel[i, axis]
+            if a - v > 0:                                # Closing in on the lower wall
+                t = max(x - r, 0.0)/(a - v)
+                if t < tr:
+                    tr, wall = t, -1-2*axis
+            if v + a > 0:                                # Closing in on the upper wall
+                t = max(self.L - x - r, 0.0)/(v + a)
+                if t < tr:
+                    tr, wall = t, -2-2*axis
+        return tr, wall
+
+    def predict(self, i, pair=None):
+        '''
+        Schedule the next event of ball i, pair is its (time, partner) if already known
+        '''
+        tc, j = self.pair_time(i) if pair is None else pair
+        tr, wall = self.wall_time(i)
+        if tr < tc:
+            tc, j = tr, wall
+        if self.start is not None:
+            tr = self.skin_time(i)
+            if tr < tc:
+                tc, j = tr, rebuild
+        old = self.partner[i]
+        if old >= 0:
+            self.waiting[old].discard(i)
+        self.partner[i] = j
+        if tc == float('inf'):
+            return
+        if j >= 0:
+            self.waiting[j].add(i)
+            count_j = self.counts[j]
+        else:
+            count_j = 0
+        self.seq += 1
+        heapq.heappush(self.events, (self.t + tc, self.seq, i, j, self.counts[i], count_j))
+
+    def collide(self, i, j):
+        '''
+        Elastic collision of two growing balls, they leave with the growth rate
+        '''
+        n = self.pos[i] - self.pos[j]
+        if not self.hard:
+            n = minimum_image(n, self.L)
+        r = np.sqrt(n.dot(n))
+        n /= r
+        dv = (self.vel[i] - self.vel[j]).dot(n)
+        h = self.a[i] + self.a[j]
+        self.vel[i] += (h - dv)*n
+        self.vel[j] -= (h - dv)*n
+        self.virial += float(r*(h - dv))                 # r_ij . dv_i of this collision
+
+    def reflect(self, i, wall):
+        '''
+        Reflect ball i from a wall, it leaves faster than it grows
+        '''
+        axis = (-1-wall)//2
+        if wall % 2:                                     # Lower wall
+            self.vel[i, axis] = 2*self.a[i] - self.vel[i, axis]
+        else:                                            # Upper wall
+            self.vel[i, axis] = -2*self.a[i] - self.vel[i, axis]
+
+    def step(self, t_max=float('inf')):
+        '''
+        Process the next valid event if it happens before t_max, otherwise move the
+        clock to t_max. Returns the (i, j) of the event or None.
+        '''
+        while self.events:
+            t, seq, i, j, count_i, count_j = self.events[0]
+            if count_i != self.counts[i] or (j >= 0 and count_j != self.counts[j]):
+                heapq.heappop(self.events)               # Stale event
+                continue
+            if t > t_max:
+                break
+            heapq.heappop(self.events)
+            self.t = t
+            self.advance(i)
+            touched = [i]
+            if j == recheck:
+                self.predict(i)                          # Nothing changed, the other balls keep their events
+                return i, j
+            if j == rebuild:
+                self.renew()
+                return i, j
+            if j >= 0:
+                self.advance(j)
+                self.collide(i, j)
+                touched.append(j)
+                self.n_collisions += 1
+            else:
+                self.reflect(i, j)
+                self.n_walls += 1
+            # Balls waiting on one of these balls have to look again
+            redo = set(touched)
+            for k in touched:
+                self.counts[k] += 1
+                redo |= self.waiting[k]
+            for k in sorted(redo):
+                if k not in touched:
+                    self.advance(k)
+                self.predict(k)
+            return i, j
+        if t_max != float('inf'):
+            self.t = t_max
+        return None
+
+    def predict_all(self):
+        '''
+        Schedule the next event of every ball, all balls must be up to date
+        The pair times of all listed pairs are computed at once.
+        '''
+        N = len(self.radius)
+        if self.start is None:
+            for i in range(N):
+                self.predict(i)
+            return
+        rows = np.repeat(np.arange(N), np.diff(self.start))
+        tc = self.pair_times(rows, self.flat)
+        # Earliest pair of every row, the lowest partner on ties like pair_time
+        order = np.lexsort((tc, rows))
+        for i in range(N):
+            if self.start[i] < self.start[i+1] and tc[order[self.start[i]]] != np.inf:
+                m = order[self.start[i]]
+                self.predict(i, (float(tc[m]), int(self.flat[m])))
+            else:
+                self.predict(i, (float('inf'), -1))
+
+    def renew(self):
+        '''
+        Rebuild the neighbour lists at the current time and predict every ball again
+        '''
+        self.sync()
+        self.build()
+        self.events = []
+        self.partner[:] = -1
+        self.waiting = [set() for i in range(len(self.radius))]
+        self.n_rebuilds += 1
+        self.predict_all()
+
+    def run_until(self, t, max_events=None):
+        '''
+        Process all events up to time t, returns the number of events
+        With max_events the clock stops at the last event once that many were processed,
+        near jamming the events pile up and time would hardly move on.
+        '''
+        n = 0
+        while (max_events is None or n < max_events) and self.step(t) is not None:
+            n += 1
+        return n
+
+    def volume_fraction(self):
+        '''
+        Fraction of the box filled by the balls at the current time
+        '''
+        radius = self.radius + self.a*(self.t - self.t_ball)
+        return (4/3)*np.pi*np.sum(radius**3)/self.L**3
@@ -0,0 +1,201 @@
+# Initial configurations of balls that do not overlap, from a seeded NumPy generator
+
+import itertools
+import math
+import numpy as np
+from cell_list import CellList
+from vectorized import minimum_image
+from jamming import packing_fraction
+
+# Positions of the 4 balls of a face centered cubic unit cell, in cell lengths
+fcc_basis = np.array([[0,0,0], [0.5,0.5,0], [0.5,0,0.5], [0,0.5,0.5]])
+
+def radius_for_volume_frac(N, L, volume_frac):
+    '''
+    Radius of N equal balls filling volume_frac of a box of length L
+    '''
+    return (3*volume_frac*L**3/(4*math.pi*N))**(1/3)
+
+def random_velocities(N, rng, speed=0.1):
+    '''
+    Velocities with every component uniform in [-speed, speed] like the original initialization
+    '''
+    return rng.uniform(-speed, speed, (N,3))
+
+def rsa_positions(N, radius, L, rng, periodic=False, batch=None, max_rounds=1000):
+    '''
+    Random sequential addition of N balls of the given radius
+    The box is split in a grid of cells too small to hold two balls, every cell holds
+    the index of its ball. Cells that lie entirely within a diameter of a placed ball
+    are marked covered and candidates are only drawn in the other cells, which keeps
+    the additions uniform over the free space while it shrinks. Candidates are drawn
+    in batches, checked against the placed balls with the grid and against each other,
+    where the earlier candidate is kept.
+    Works up to a volume fraction of about 0.33 in a periodic box and 0.25 with hard
+    walls, where the balls cannot use the space along the walls. Use lattice_positions
+    above that.
+    '''
+    d = 2*radius
+    lo, hi = (0.0, L) if periodic else (radius, L - radius)
+    if hi <= lo:
+        raise ValueError("Balls of radius {} do not fit in a box of length {}".format(radius, L))
+    n = int(L*math.sqrt(3)/d) + 1 if d > 0 else 1       # Cell diagonal shorter than a diameter
+    width = L / n
+    reach = math.ceil(d / width)                         # Cells to look at on each side
+    offsets = np.array(list(itertools.product(range(-reach, reach+1), repeat=3)))
+    offsets = offsets[((np.maximum(np.abs(offsets) - 1, 0)*width)**2).sum(axis=1) < d*d]
+    # Index of the ball in each cell, with reach layers of ghost cells around the grid that
+    # repeat the other side in a periodic box and stay empty with hard walls
+    size = n + 2*reach
+    grid = np.full(size**3, -1, dtype=np.int64)
+    flat_offsets = (offsets[:,0]*size + offsets[:,1])*size + offsets[:,2]
+    ghosts = np.array(list(itertools.product((-n,0,n), repeat=3))) if periodic else np.zeros((1,3), dtype=np.int64)
+    # Cells without any point a center could be at
+    edge = np.arange(n)*width
+    out = (edge + width <= lo) | (edge >= hi)
+    covered = out[:,None,None] | out[None,:,None] | out[None,None,:]
+    pos = np.empty((N,3))
+    placed = 0
+    batch = batch or max(64, N//8)
+    for rounds in range(max_rounds):
+        free = np.flatnonzero(~covered.ravel())
+        if placed == N or len(free) == 0:
+            break
+        draw = max(64, min(batch, len(free)))          # More candidates than free cells mostly clash
+        cells = np.stack(np.unravel_index(free[rng.integers(len(free), size=draw)], covered.shape), axis=1)
+        cand = (cells + rng.random((draw,3)))*width
+        keep = ((cand >= lo) & (cand <= hi)).all(axis=1)
+        cand, cells = cand[keep], cells[keep]
+        # Clashes with the placed balls
+        padded = cells + reach
+        other = grid[((padded[:,0]*size + padded[:,1])*size + padded[:,2])[:,None] + flat_offsets[None]]
+        k, m = np.nonzero(other >= 0)
+        r = cand[k] - pos[other[k,m]]
+        if periodic:
+            r = minimum_image(r, L)
+        clash = np.zeros(len(cand), dtype=bool)
+        clash[k[np.einsum('ij,ij->i', r, r) < d*d]] = True
+        cand, cells = cand[~clash], cells[~clash]
+        # Clashes between the candidates, the earlier one is kept
+        i, j = CellList(L, d, periodic).build(cand).pairs()
+        r = cand[i] - cand[j]
+        if periodic:
+            r = minimum_image(r, L)
+        close = np.einsum('ij,ij->i', r, r) < d*d
+        i, j = i[close], j[close]
+        dropped = np.zeros(len(cand), dtype=bool)
+        for k in np.argsort(j, kind='stable').tolist():
+            if not dropped[i[k]]:
+                dropped[j[k]] = True
+        cand, cells = cand[~dropped][:N-placed], cells[~dropped][:N-placed]
+        pos[placed:placed+len(cand)] = cand
+        for shift in ghosts:
+            padded = cells + reach + shift
+            ok = ((padded >= 0) & (padded < size)).all(axis=1)
+            padded = padded[ok]
+            grid[(padded[:,0]*size + padded[:,1])*size + padded[:,2]] = np.arange(placed, placed+len(cand))[ok]
+        placed += len(cand)
+        # Cover the cells whose farthest corner is within a diameter of a new ball
+        nb = cells[:,None,:] + offsets[None]
+        far = np.abs((nb + 0.5)*width - cand[:,None,:]) + width/2
+        nb = nb[np.einsum('ijk,ijk->ij', far, far) < d*d]
+        if periodic:
+            nb %= n
+        else:
+            nb = nb[((nb >= 0) & (nb < n)).all(axis=1)]
+        covered[nb[:,0], nb[:,1], nb[:,2]] = True
+    if placed == N:
+        return pos
+    raise ValueError("Random sequential addition placed only {} of {} balls, "
+                     "use the lattice for this volume fraction".format(placed, N))
+
+def nearest_sites(shape, grid, periodic=False):
+    '''
+    Distance between the nearest sites of lattices with shape[k] sites along each axis
+    spaced grid[k] apart, see lattice_shape
+    '''
+    if periodic:
+        # An odd number of sites puts two sites of the same parity next to each other across the wrap
+        nearest = np.where(shape % 2 == 1, grid, 2*grid).min(axis=1)
+    else:
+        nearest = np.where(shape > 2, 2*grid, np.inf).min(axis=1)
+    for a, b in ((0, 1), (0, 2), (1, 2)):
+        face = (shape[:,a] > 1) & (shape[:,b] > 1)
+        nearest = np.where(face, np.minimum(nearest, np.hypot(grid[:,a], grid[:,b])), nearest)
+    return nearest
+
+def lattice_shape(N, L, periodic=False):
+    '''
+    Sites along each axis of the face centered cubic lattice for N balls that holds the
+    largest balls, and the radius of those balls
+    The lattice is the grid of the sites (i, j, k) with i + j + k even, so the number of
+    sites along each axis can be chosen freely to fit N. With hard walls the outer sites
+    are a radius away from the walls.
+    '''
+    c = math.ceil((2*N)**(1/3))
+    nx, ny = np.meshgrid(np.arange(1, 4*c + 1), np.arange(1, 4*c + 1), indexing='ij')
+    nx, ny = nx.ravel(), ny.ravel()
+    nz = np.maximum(np.ceil((2*N - 1)/(nx*ny)), 1)      # Fewest layers with (nx*ny*nz + 1)//2 >= N sites
+    # One more layer can be better in a periodic box, where an odd number of sites is not
+    shape = np.concatenate((np.stack((nx, ny, nz), axis=1), np.stack((nx, ny, nz + 1), axis=1))).astype(np.int64)
+    # Spacing in box lengths, or with hard walls in lengths between the outer sites
+    if periodic:
+        nearest = nearest_sites(shape, 1/shape, True)
+        radius = nearest*L/2
+    else:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            nearest = nearest_sites(shape, np.where(shape > 1, 1/(shape - 1), np.inf))
+            radius = nearest*L/(2 + 2*nearest)           # Balls touch when nearest*(L - 2r) = 2r
+        radius[np.isinf(nearest)] = L/2                  # A single site
+    radius = np.minimum(radius, L/2)
+    best = int(np.argmax(radius))
+    return tuple(shape[best].tolist()), float(radius[best])
+
+def lattice_positions(N, radius, L, rng, periodic=False):
+    '''
+    N balls on randomly chosen sites of a face centered cubic lattice, each moved by a
+    random jitter small enough that no two balls overlap
+    The sites along each axis come from lattice_shape, balls larger than it allows raise
+    a ValueError giving the largest volume fraction.
+    '''
+    shape, largest = lattice_shape(N, L, periodic)
+    if radius > largest:
+        raise ValueError("{} balls of radius {} do not fit on a lattice in a box of length {}, at most radius "
+                         "{:.4g} (volume fraction {:.3f})".format(N, radius, L, largest,
+                                                                  packing_fraction(np.full(N, largest), L)))
+    shape = np.array([shape])
+    if periodic:
+        grid = L/shape
+        start = 0.0
+    else:
+        # The outer sites are a radius away from the walls, a single layer is in the middle
+        grid = np.where(shape > 1, (L - 2*radius)/np.maximum(shape - 1, 1), np.inf)
+        start = np.where(shape > 1, radius, L/2)
+    spacing = float(nearest_sites(shape, grid, periodic)[0])
+    grid = np.where(np.isinf(grid), 0.0, grid)
+    sites = np.indices(shape[0]).reshape(3, -1).T
+    sites = sites[sites.sum(axis=1) % 2 == 0]
+    pos = start + sites[rng.choice(len(sites), N, replace=False)]*grid
+    # A jitter of at most half the free space between nearest sites in any direction
+    jitter = min((spacing - 2*radius)/2/math.sqrt(3), L) if N > 1 else 0.0
+    pos += rng.uniform(-jitter, jitter, (N,3))
+    if periodic:
+        pos %= L
+    else:
+        # Moving a ball back towards its site keeps it clear of the others
+        np.clip(pos, radius, L - radius, out=pos)
+    return pos
+
+def initial_configuration(N, L, radius, seed=None, method='rsa', periodic=False):
+    '''
+    Positions and velocities of N balls of the given radius that do not overlap
+    method is 'rsa' for random sequential addition or 'lattice' for a jittered lattice
+    '''
+    rng = np.random.default_rng(seed)
+    if method == 'rsa':
+        pos = rsa_positions(N, radius, L, rng, periodic)
+    elif method == 'lattice':
+        pos = lattice_positions(N, radius, L, rng, periodic)
+    else:
+        raise ValueError("Unknown initialization method " + repr(method))
+    return pos, random_velocities(N, rng)
@@ -0,0 +1,95 @@
+# Online estimates of the state of the packing and the criteria to stop a jammed run
+
+import math
+from collections import deque
+import numpy as np
+
+def packing_fraction(radius, L):
+    '''
+    Fraction of the box of length L filled by balls of the given radii
+    '''
+    return (4/3)*math.pi*float(np.sum(np.asarray(radius)**3))/L**3
+
+class JammingMonitor:
+    '''
+    Collision rate, reduced pressure and packing fraction over the last window collisions
+    per ball. Every step adds a sample of the running totals of the simulation, the
+    estimates are the differences between the newest and the oldest sample:
+      collision_rate  pair collisions (overlap corrections included) per ball and unit time
+      pressure        reduced pressure PV/NkT = 1 + sum(r_ij . dv_i) / integral(sum |v|^2 dt)
+                      from the virial of the velocity changes of the pair collisions
+      growth          increase of the packing fraction over the window
+    The window is counted in collisions rather than steps, so it fills at the same pace
+    whether a step is a fixed dt, an adaptive one or a frame of events cut short by
+    max_events. The oldest sample kept is the newest one at least window collisions per
+    ball back. The run is jammed once the window is full and any enabled criterion is
+    met: the pressure goes above max_pressure, the collision rate above
+    max_collision_rate or the growth below min_growth. A criterion set to None is not
+    checked.
+    '''
+    def __init__(self, window=10, max_pressure=None, max_collision_rate=None, min_growth=None):
+        self.window = window                             # Collisions per ball the estimates are taken over
+        self.max_pressure = max_pressure                 # Reduced pressure of a jammed packing
+        self.max_collision_rate = max_collision_rate     # Collisions per ball and unit time of a jammed packing
+        self.min_growth = min_growth                     # Smallest packing fraction increase over the window
+        self.kinetic = 0.0                               # Integral of sum |v|^2 over the simulation time
+        self.samples = deque()                           # (t, collisions per ball, virial, kinetic, packing fraction)
+        self.reason = None                               # Criterion that found the run jammed
+
+    def update(self, sim, del_t):
+        '''
+        Add the sample of the step of length del_t that sim just took
+        '''
+        vel = sim.store.vel
+        self.kinetic += float(np.einsum('ij,ij->', vel, vel))*del_t
+        collisions = (sim.collisions + sim.stats['overlap_corrections'])/len(vel)
+        self.samples.append((float(sim.t), collisions, sim.stats['virial'], self.kinetic,
+                             packing_fraction(sim.store.radius, sim.L)))
+        # Drop the samples that are no longer needed to span the window
+        while len(self.samples) > 1 and self.samples[1][1] <= collisions - self.window:
+            self.samples.popleft()
+
+    @property
+    def packing_fraction(self):
+        return self.samples[-1][4] if self.samples else None
+
+    @property
+    def collision_rate(self):
+        if len(self.samples) < 2:
+            return None
+        (t0, c0, _, _, _), (t1, c1, _, _, _) = self.samples[0], self.samples[-1]
+        return (c1 - c0)/(t1 - t0) if t1 > t0 else float('inf')
+
+    @property
+    def pressure(self):
+        if len(self.samples) < 2:
+            return None
+        (_, _, w0, k0, _), (_, _, w1, k1, _) = self.samples[0], self.samples[-1]
+        return 1 + (w1 - w0)/(k1 - k0) if k1 > k0 else float('inf')
+
+    @property
+    def growth(self):
+        if len(self.samples) < 2:
+            return None
+        return self.samples[-1][4] - self.samples[0][4]
+
+    def jammed(self):
+        '''
+        Whether the run is jammed, the criterion that was met is kept in reason
+        '''
+        if len(self.samples) < 2 or self.samples[-1][1] - self.samples[0][1] < self.window:
+            return False
+        if self.max_pressure is not None and self.pressure > self.max_pressure:
+            self.reason = 'pressure'
+        elif self.max_collision_rate is not None and self.collision_rate > self.max_collision_rate:
+            self.reason = 'collision_rate'
+        elif self.min_growth is not None and self.growth < self.min_growth:
+            self.reason = 'growth'
+        return self.reason is not None
+
+    def estimates(self):
+        '''
+        Current estimates as a dict
+        '''
+        return {'packing_fraction': self.packing_fraction, 'collision_rate': self.collision_rate,
+                'pressure': self.pressure, 'growth': self.growth}
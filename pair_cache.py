@@ -0,0 +1,235 @@
+import numpy as np
+from cell_list import CellList
+from vectorized import (balls_to_arrays, minimum_image, overlapping_pairs, pair_terms, pair_times,
+                        resolve_overlap)
+
+class PairTimeCache:
+    '''
+    Next collision of every ball kept between steps, in absolute simulation time
+    Balls move on straight lines and grow at a constant rate between velocity changes,
+    so a predicted collision time stays the same until one of the two balls changes
+    velocity. Pairs come from neighbour lists built with a CellList of cutoff
+    2*rmax + skin. They are built again once some ball could have moved and grown by
+    skin/2 within max_dt from now, so every pair able to collide within max_dt is
+    listed and min(tc, max_dt) is the same as with the full pair search, like
+    Calculate_tc_cells.
+    Every step the listed pairs are checked for overlaps, which are resolved one by one
+    in the order of the double loop of Calculate_tc. Only the rows of the balls whose
+    velocity changed, that took part in an overlap, whose recheck time has come or
+    whose partner is one of those are computed again, against their neighbours only.
+    A pair is predicted with the velocities the double loop would see at its place,
+    before or after the overlap corrections of its balls, so a step costs O(N) and
+    gives the numpy method's results up to rounding.
+    The rule of Calculate_tc only predicts pairs whose growth outpaces their relative
+    speed, and whether a pair passes it changes over time. The recheck time of a pair
+    is when that happens, or in a periodic box when another image could come into reach.
+    '''
+    def __init__(self, N, L=1, periodic=False, a=None, skin=None, max_dt=0.02):
+        self.L = L                                       # Length of the box
+        self.periodic = periodic                         # Periodic box, else hard walls
+        self.a = a                                       # Growth rates to predict with, None for the balls' own
+        self.skin = skin                                 # Margin of the neighbour lists, the largest radius if None
+        self.max_dt = max_dt                             # Longest step the predictions have to hold for
+        self.vel = None                                  # Velocity each row was computed with
+        self.tc = np.full(N, np.inf)                     # Time of the earliest collision of each ball
+        self.partner = np.full(N, -1, dtype=np.int64)    # Ball of that collision
+        self.due = np.full(N, np.inf)                    # Time the row of each ball must be computed again
+        self.due_partner = np.full(N, -1, dtype=np.int64)
+        self.start = None                                # Neighbour lists as start/flat arrays, None before the first step
+        self.rows = 0                                    # Number of rows computed so far
+        self.builds = 0                                  # Number of neighbour list builds
+
+    def build(self, pos, radius):
+        '''
+        Neighbour lists of all balls, pairs closer than skin (surface to surface)
+        With fewer than 3 cells along an axis of a periodic box every pair is listed and
+        the lists never expire.
+        '''
+        N = len(pos)
+        rmax = float(radius.max())
+        self.margin = rmax if self.skin is None else self.skin
+        cells = CellList(self.L, 2*rmax + self.margin, self.periodic)
+        if self.periodic and cells.n < 3:
+            lo, hi = np.triu_indices(N, 1)
+            self.pos0 = None
+        else:
+            lo, hi = cells.build(pos).pairs()
+            r = pos[lo] - pos[hi]
+            if self.periodic:
+                r = minimum_image(r, self.L)
+            close = np.sqrt(np.einsum('ij,ij->i', r, r)) - radius[lo] - radius[hi] < self.margin
+            lo, hi = lo[close], hi[close]
+            self.pos0 = pos.copy()                       # Positions and radii the lists were built with
+            self.radius0 = radius.copy()
+        self.lo, self.hi = lo, hi                        # Listed pairs in the order of Calculate_tc
+        ends = np.concatenate((lo, hi))
+        other = np.concatenate((hi, lo))
+        self.flat = other[np.lexsort((other, ends))]
+        self.start = np.concatenate(([0], np.cumsum(np.bincount(ends, minlength=N))))
+        self.vel = None                                  # Every row has to be computed again
+        self.builds += 1
+
+    def expired(self, pos, vel, radius, a, horizon):
+        '''
+        Whether some ball could have moved and grown by skin/2 since the lists were built
+        by horizon from now
+        '''
+        if self.start is None:
+            return True
+        if self.pos0 is None:
+            return False
+        d = pos - self.pos0
+        if self.periodic:
+            d = minimum_image(d, self.L)
+        used = np.sqrt(np.einsum('ij,ij->i', d, d)) + radius - self.radius0
+        used += horizon*(np.sqrt(np.einsum('ij,ij->i', vel, vel)) + np.abs(a))
+        return bool((2*used >= self.margin).any())
+
+    def dirty(self, vel, t, lo, hi):
+        '''
+        Balls whose row has to be computed again at time t, lo and hi are the touching pairs
+        '''
+        if self.vel is None:
+            return np.arange(len(vel))
+        changed = (vel != self.vel).any(axis=1) | (self.due <= t)
+        changed[lo] = True
+        changed[hi] = True
+        # Balls whose stored collision is with a changed ball lost their minimum
+        lost = self.partner >= 0
+        lost[lost] = changed[self.partner[lost]]
+        return np.flatnonzero(changed | lost)
+
+    def predict(self, balls, N, t, stats=None):
+        '''
+        Algorithm 4.2 from the cache at time t, same (tc, particles) contract as Calculate_tc
+        '''
+        if N < 2:
+            return float('inf'), []
+        pos, vel, radius, a = balls_to_arrays(balls[:N])
+        if self.a is not None:
+            a = self.a
+        if self.expired(pos, vel, radius, a, 0.0):
+            self.build(pos, radius)                      # Every overlapping pair has to be listed
+        box = self.L if self.periodic else None
+        touching = overlapping_pairs(pos, radius, self.lo, self.hi, box)
+        lo, hi = self.lo[touching], self.hi[touching]
+        before = vel.copy()
+        history = self.resolve(balls, pos, vel, lo, hi, stats)
+        if self.expired(pos, vel, radius, a, self.max_dt):
+            self.build(pos, radius)                      # The corrections sped balls up too much for the lists
+        rows = self.dirty(before, t, lo, hi)
+        self.update(pos, before, radius, a, rows, t, history)
+        k = int(np.argmin(self.tc))
+        if not np.isfinite(self.tc[k]):
+            return float('inf'), []
+        j = int(self.partner[k])
+        return max(float(self.tc[k] - t), 0.0), [balls[min(k, j)], balls[max(k, j)]]
+
+    def resolve(self, balls, pos, vel, lo, hi, stats=None):
+        '''
+        Resolve the touching pairs (lo[k], hi[k]) in order, like Calculate_tc does
+        Returns the velocity of both balls after every pair, as (keys, balls, velocities)
+        sorted by ball and then by the place key = lo*N + hi of the pair in the double loop.
+        '''
+        N = len(pos)
+        box = self.L if self.periodic else None
+        after = np.empty((2*len(lo), 3))
+        for k, (p, q) in enumerate(zip(lo.tolist(), hi.tolist())):
+            resolve_overlap(balls, pos, vel, p, q, box, stats)
+            after[2*k] = vel[p]
+            after[2*k+1] = vel[q]
+        ends = np.stack((lo, hi), axis=1).ravel()
+        keys = np.repeat(lo*N + hi, 2)
+        order = np.lexsort((keys, ends))
+        return keys[order], ends[order], after[order]
+
+    def update(self, pos, vel, radius, a, rows, t, history):
+        '''
+        Compute the rows of the balls in rows again at time t, vel are the velocities
+        before the overlap corrections of history
+        '''
+        N = len(pos)
+        for times, partner in ((self.tc, self.partner), (self.due, self.due_partner)):
+            times[rows] = np.inf
+            partner[rows] = -1
+        in_rows = np.zeros(N, dtype=bool)
+        in_rows[rows] = True
+        count = self.start[rows+1] - self.start[rows]
+        i = np.repeat(rows, count)
+        first = np.repeat(self.start[rows] - (np.cumsum(count) - count), count)
+        j = self.flat[first + np.arange(len(i))]
+        # Every pair once, a pair of two rows belongs to the row of the smaller ball
+        keep = ~(in_rows[j] & (j < i))
+        lo, hi = np.minimum(i[keep], j[keep]), np.maximum(i[keep], j[keep])
+        tc, due = self.compute(pos, vel, radius, a, lo, hi, history)
+        self.merge(self.tc, self.partner, lo, hi, t + tc)
+        self.merge(self.due, self.due_partner, lo, hi, t + due)
+        if self.vel is None:
+            self.vel = vel.copy()
+        self.vel[rows] = vel[rows]                       # Balls corrected since are dirty next step
+        self.rows += len(rows)
+
+    def compute(self, pos, vel, radius, a, lo, hi, history):
+        '''
+        Collision and recheck times from now of the pairs (lo[k], hi[k]) with lo < hi
+        Each ball of a pair moves with its velocity after the last overlap correction in
+        history that comes before the pair in the double loop, else with vel.
+        '''
+        N = len(pos)
+        box = self.L if self.periodic else None
+        keys, ends, after = history
+        i, j = lo, hi
+        if len(ends):
+            # Every correction is one more ball at the same place with another velocity,
+            # ball b of the pair at place key is the last correction of b before key
+            code = ends*N*N + keys
+            pair = lo*N + hi
+            last = np.searchsorted(code, lo*N*N + pair) - 1
+            i = np.where((last >= 0) & (ends[np.maximum(last, 0)] == lo), N + last, lo)
+            last = np.searchsorted(code, hi*N*N + pair) - 1
+            j = np.where((last >= 0) & (ends[np.maximum(last, 0)] == hi), N + last, hi)
+            pos = np.concatenate((pos, pos[ends]))
+            vel = np.concatenate((vel, after))
+            radius = np.concatenate((radius, radius[ends]))
+            a = np.concatenate((a, a[ends]))
+        tc = pair_times(pos, vel, radius, a, i, j, box)
+        tc[overlapping_pairs(pos, radius, i, j, box)] = np.inf   # Calculate_tc resolves these instead
+        qa, qb, qc, r, v = pair_terms(pos, vel, radius, a, i, j, box)
+        # The rule qb - qa*qc > 0 of a pair with qa < 0 flips at the roots of
+        # f(t) = -qa^2 t^2 + qa (1 - 2 qb) t + qb - qa qc
+        fa = -qa**2
+        fb = qa*(1 - 2*qb)
+        fc = qb - qa*qc
+        disc = fb**2 - 4*fa*fc
+        due = np.full(len(qa), np.inf)
+        ok = (qa < 0) & (qc > 0) & (disc >= 0)
+        root = np.sqrt(disc[ok])
+        first = (-fb[ok] + root)/(2*fa[ok])
+        second = (-fb[ok] - root)/(2*fa[ok])
+        due[ok] = np.where(first > 0, first, np.where(second > 0, second, np.inf))
+        if self.periodic:
+            # The other images are at least L - |r_k| away along some axis k
+            gap = self.L - np.abs(r) - (radius[i] + radius[j])[:,None]
+            speed = np.abs(v) + (a[i] + a[j])[:,None]
+            with np.errstate(divide='ignore'):
+                image = np.where(speed > 0, np.maximum(gap, 0)/speed, np.inf)
+            due = np.minimum(due, image.min(axis=1))
+        return tc, due
+
+    @staticmethod
+    def merge(times, partner, i, j, new):
+        '''
+        Lower times[k] to the earliest of the new pair times of ball k
+        '''
+        if len(i) == 0:
+            return
+        ends = np.concatenate((i, j))
+        other = np.concatenate((j, i))
+        new = np.concatenate((new, new))
+        order = np.lexsort((new, ends))
+        ends, other, new = ends[order], other[order], new[order]
+        first = np.flatnonzero(np.concatenate(([True], ends[1:] != ends[:-1])))
+        ends, other, new = ends[first], other[first], new[first]
+        better = new < times[ends]
+        times[ends[better]] = new[better]
+        partner[ends[better]] = other[better]
@@ -0,0 +1,232 @@
+# Domain decomposition of the collision search over worker processes sharing the ball arrays
+
+import multiprocessing
+import os
+from multiprocessing import shared_memory
+import numpy as np
+from utilities import BallStore
+from cell_list import CellList
+from vectorized import overlapping_pairs, pair_times, resolve_overlap
+
+class SharedBallStore(BallStore):
+    '''
+    BallStore whose positions, velocities, radii and growth rates live in one
+    multiprocessing.shared_memory block, so worker processes see every update
+    Without a name a new block is made, with the name of a block it is attached to.
+    '''
+    __slots__ = ('shm', 'owner')
+
+    def __init__(self, N, name=None):
+        self.owner = name is None                     # This store made the block and unlinks it
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=max(8*8*N, 8))
+        data = np.ndarray(8*N, buffer=self.shm.buf)
+        self.pos = data[:3*N].reshape(N,3)
+        self.vel = data[3*N:6*N].reshape(N,3)
+        self.radius = data[6*N:7*N]
+        self.a = data[7*N:]
+        if self.owner:
+            data[:7*N] = 0
+            self.a[:] = 0.01
+        self.scratch = np.zeros((N,3))
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def close(self):
+        '''
+        Release the block, the store that made it also removes it
+        The arrays are copied to private memory so the store can still be read.
+        '''
+        self.pos = self.pos.copy()
+        self.vel = self.vel.copy()
+        self.radius = self.radius.copy()
+        self.a = self.a.copy()
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+def colour(k, S, periodic):
+    '''
+    Pass in which slab k of S resolves its overlaps
+    Slab k shares balls with slabs k-1 and k+1 only, so even and odd slabs take turns.
+    In a periodic box with an odd number of slabs the last one is next to slab 0 and
+    gets a third pass.
+    '''
+    if periodic and S > 1 and S % 2 and k == S - 1:
+        return 2
+    return k % 2
+
+class Slab:
+    '''
+    Slab k of S along x of the box, with the pairs it is responsible for
+    A slab owns the balls inside it and looks at the balls of the next slab that are
+    closer than cutoff to its upper side (the halo), the last slab wraps around to the
+    first in a periodic box. Slabs are at least cutoff wide, so every pair closer than
+    cutoff is found by exactly one slab.
+    '''
+    def __init__(self, store, L, periodic):
+        self.store = store
+        self.balls = store.balls()                       # Views of the shared store for resolve_overlap
+        self.L = L
+        self.periodic = periodic
+        self.i = self.j = np.empty(0, dtype=np.int64)    # Pairs of the current step, i < j
+        self.touching = np.empty(0, dtype=bool)          # Pairs that overlap
+
+    def pairs(self, k, S, cutoff):
+        '''
+        Find the pairs of slab k of S closer than cutoff and which of them overlap
+        '''
+        pos, radius, L = self.store.pos, self.store.radius, self.L
+        width = L / S
+        x = pos[:,0]
+        slab = np.floor(x / width).astype(np.int64)
+        if self.periodic:
+            slab %= S
+        else:
+            np.clip(slab, 0, S-1, out=slab)
+        own = np.flatnonzero(slab == k)
+        if S == 1:
+            halo = np.empty(0, dtype=np.int64)
+        elif self.periodic:
+            halo = np.flatnonzero((slab == (k+1) % S) & ((x - k*width) % L < width + cutoff))
+        elif k + 1 < S:
+            halo = np.flatnonzero((slab == k+1) & (x < (k+1)*width + cutoff))
+        else:
+            halo = np.empty(0, dtype=np.int64)
+        local = np.concatenate((own, halo))
+        local_pos = pos[local]
+        if self.periodic:
+            local_pos[:,0] = (local_pos[:,0] - k*width) % L   # The slab starts at 0
+        a, b = CellList(L, cutoff, self.periodic).build(local_pos).pairs()
+        keep = (a < len(own)) | (b < len(own))           # Halo pairs belong to the next slab
+        if self.periodic and S > 1:
+            # Pairs the grid wrapped around in x belong to the slab on the other side
+            keep &= np.abs(local_pos[a,0] - local_pos[b,0]) <= L/2
+        a, b = local[a[keep]], local[b[keep]]
+        self.i, self.j = np.minimum(a, b), np.maximum(a, b)
+        self.touching = overlapping_pairs(pos, radius, self.i, self.j, self.L if self.periodic else None)
+
+    def resolve(self):
+        '''
+        Resolve the overlapping pairs found by pairs in the order of the double loop of
+        Calculate_tc, returns their stats
+        '''
+        stats = {'overlap_corrections': 0, 'virial': 0.0}
+        i, j = self.i[self.touching], self.j[self.touching]
+        box = self.L if self.periodic else None
+        for m in np.lexsort((j, i)).tolist():
+            resolve_overlap(self.balls, self.store.pos, self.store.vel, int(i[m]), int(j[m]), box, stats)
+        return stats
+
+    def predict(self):
+        '''
+        Earliest collision among the pairs that do not overlap, as (tc, i, j)
+        '''
+        store = self.store
+        tc = pair_times(store.pos, store.vel, store.radius, store.a, self.i, self.j,
+                        self.L if self.periodic else None)
+        tc[self.touching] = np.inf
+        if len(tc) == 0:
+            return float('inf'), -1, -1
+        k = int(np.argmin(tc))
+        return float(tc[k]), int(self.i[k]), int(self.j[k])
+
+def slab_worker(conn, name, N, L, periodic, k, barrier):
+    '''
+    Worker process of slab k, answers the requests of a SlabPool until it is closed
+    Every worker waits at the barrier after each pass, also the ones without a slab.
+    '''
+    store = SharedBallStore(N, name)
+    slab = Slab(store, L, periodic)
+    while True:
+        request = conn.recv()
+        if request[0] == 'step':
+            S, cutoff = request[1:]
+            if k < S:
+                slab.pairs(k, S, cutoff)
+            stats = None
+            for c in range(3):
+                if k < S and colour(k, S, periodic) == c:
+                    stats = slab.resolve()
+                barrier.wait()
+            conn.send((stats, slab.predict()) if k < S else None)
+        else:
+            break
+    store.close()
+    conn.close()
+
+class SlabPool:
+    '''
+    Algorithm 4.2 split in slabs along x, one worker process per slab
+    A step is one request to every worker and one answer back. Every slab finds its
+    pairs closer than the cutoff and then resolves all of its overlapping pairs, the
+    ones with balls of its halo too, in the order of the double loop of Calculate_tc.
+    Neighbouring slabs share balls, so the slabs resolve in passes (see colour) with a
+    barrier between them, and only slabs that share no ball write the shared velocities
+    at the same time. After the last pass every slab returns its earliest collision
+    with the new velocities and the stats of its overlaps.
+    A group of linked overlapping pairs that crosses a slab boundary is resolved slab
+    by slab in the order of the passes, so the results depend on the number of slabs
+    and match Calculate_tc only for one slab, but not on which worker finishes first.
+    The slab of a ball is taken from its position in every step, so balls that moved
+    into another slab or were wrapped around by collision_wall need no bookkeeping.
+    Unlike Calculate_tc, the overlaps are all resolved before any collision is predicted.
+    '''
+    def __init__(self, store, L, periodic=False, workers=None, max_dt=0.02):
+        self.store = store
+        self.L = L
+        self.periodic = periodic
+        self.max_dt = max_dt                             # Steps are never longer, like Calculate_tc_cells
+        workers = workers or os.cpu_count() or 1
+        barrier = multiprocessing.Barrier(workers)       # Between the passes of the slabs
+        self.conns = []
+        self.procs = []
+        for k in range(workers):
+            parent, child = multiprocessing.Pipe()
+            proc = multiprocessing.Process(target=slab_worker, daemon=True,
+                                           args=(child, store.name, len(store), L, periodic, k, barrier))
+            proc.start()
+            child.close()
+            self.conns.append(parent)
+            self.procs.append(proc)
+
+    def slabs(self):
+        '''
+        Number of slabs and cutoff of the next step, slabs at least cutoff wide and at
+        most one per worker
+        '''
+        store = self.store
+        speed = np.sqrt(np.einsum('ij,ij->i', store.vel, store.vel)).max()
+        cutoff = 2*store.radius.max() + 2*self.max_dt*(speed + np.abs(store.a).max())*1.5
+        S = max(1, min(len(self.conns), int(self.L // cutoff) if cutoff > 0 else len(self.conns)))
+        return S, cutoff
+
+    def predict(self, balls, N, stats=None):
+        '''
+        Same (tc, particles) contract as Calculate_tc
+        '''
+        if N < 2:
+            return float('inf'), []
+        S, cutoff = self.slabs()
+        for conn in self.conns:
+            conn.send(('step', S, cutoff))
+        answers = [conn.recv() for conn in self.conns][:S]
+        if stats is not None:
+            for slab_stats, _ in answers:
+                stats['overlap_corrections'] += slab_stats['overlap_corrections']
+                stats['virial'] += slab_stats['virial']
+        tc, p, q = min(answer[1] for answer in answers)
+        if not np.isfinite(tc):
+            return float('inf'), []
+        return tc, [balls[p], balls[q]]
+
+    def close(self):
+        for conn in self.conns:
+            conn.send(('close',))
+        for proc in self.procs:
+            proc.join()
+        for conn in self.conns:
+            conn.close()
+        self.conns = []
+        self.procs = []
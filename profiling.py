@@ -0,0 +1,81 @@
+import json
+import math
+import time
+from contextlib import nullcontext
+
+class Profiler:
+    '''
+    Wall time spent in each phase of the simulation loop
+    Every interval steps one JSON line is written with the time per phase since the
+    previous line, the event counters of the simulation and the current tc / del_t.
+    '''
+    def __init__(self, path, interval=100):
+        self.file = open(path, 'a')                      # JSON lines output
+        self.interval = interval                         # Steps between two lines
+        self.times = {}                                  # Seconds per phase since the last line
+        self.last = time.perf_counter()                  # Time of the last line
+
+    def phase(self, name):
+        '''
+        Context manager adding the time spent inside it to the phase name
+        '''
+        return Phase(self.times, name)
+
+    def end_step(self, sim):
+        '''
+        Called after every step, writes a line every interval steps
+        '''
+        if sim.steps % self.interval:
+            return
+        now = time.perf_counter()
+        record = {
+            'step': sim.steps,
+            't': sim.t,
+            'tc': sim.last_tc if sim.last_tc is not None and math.isfinite(sim.last_tc) else None,
+            'del_t': sim.last_del_t,
+            'wall_clock': now - self.last,
+            'phases': self.times,
+            'collisions': sim.collisions,
+            'wall_collisions': sim.wall_collisions,
+            'overlap_corrections': sim.stats['overlap_corrections'],
+            'skipped_passes': sim.stats['skipped_passes'],
+            **sim.jamming.estimates(),
+        }
+        self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+        self.times = {}
+        self.last = now
+
+    def close(self):
+        self.file.close()
+
+class Phase:
+    '''
+    Timer of one phase of a Profiler
+    '''
+    __slots__ = ('times', 'name', 'start')
+
+    def __init__(self, times, name):
+        self.times = times
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.times[self.name] = self.times.get(self.name, 0.0) + time.perf_counter() - self.start
+
+class NullProfiler:
+    '''
+    Profiler that records nothing, used when profiling is off
+    '''
+    timer = nullcontext()
+
+    def phase(self, name):
+        return self.timer
+
+    def end_step(self, sim):
+        pass
+
+    def close(self):
+        pass
@@ -1,11 +1,15 @@
 # importing Libraries
 
+import argparse
+import time
+import numpy as np
 import pygame
 from pygame.locals import *
-import random
 from OpenGL.GL import *
 from OpenGL.GLU import *
 from utilities import *
+from engine import Simulation, save_balls
+from vectorized import image_arrays
 
 # User Parameters
 
@@ -16,150 +20,176 @@ final_volume_frac = 0.7     # Fraction of the volume of the box at end
 save_location = True        # Save the location of the balls
 hardCollision = True            # For simulating with hard boundaries and collisions
 increase_radius_hard = False       # Increase the radius of the balls for the hard collision
+eventDriven = False              # Use the event driven scheduler instead of time steps
+frame_time = 0.02                # Simulation time between two frames of the event driven mode
+adaptive_dt = False              # Time step of the hard collision mode from the earliest contact
+init_method = 'uniform'          # Initial positions: 'uniform', or 'rsa' and 'lattice' without overlaps
+target_fps = 30                  # Frames drawn per second at most, the simulation steps in between
 
-def Cube():
+def Cube(L=1):
     '''
-    Using OpenGL to draw a cube edges
+    Using OpenGL to build a display list with the cube edges, call it with glCallList
     '''
+    cube = glGenLists(1)
+    glNewList(cube, GL_COMPILE)
+    glPushMatrix()
+    glScalef(L, L, L)
+    glColor3f(0,0,0)                                   # Set the color to black
     glBegin(GL_LINES)
-    for edge in edges:                       # For each edge in edges taken from utilities 
-        for vertex in edge:                  # For each vertex in edge
-            glColor3fv((0,0,0))                # Set the color to black
-            glVertex3fv(verticies[vertex])          # Draw the vertex
+    for edge in edges:                                 # For each edge in edges taken from utilities 
+        for vertex in edge:                            # For each vertex in edge
+            glVertex3fv(verticies[vertex])             # Draw the vertex
     glEnd()
-
-def Sphere(ball):
-    '''
-    Using OpenGL to draw a sphere
-    ball is an object from the class Ball in ultilities.py
-    '''
-    glPushMatrix()
-    sphere = gluNewQuadric()
-    glTranslatef(ball.pos.x,ball.pos.y,ball.pos.z)                 #Move to the place
-    glColor3fv((1,0,0))                                            #Put color
-    gluSphere(sphere, ball.radius, 16, 8)                          #Draw sphere
     glPopMatrix()
-    # Also need to draw the images of cubes
-    for img in ball.images:                                       # For each image of the ball
-        if img != None:
-            Sphere(img)                                            # Draw the image of the ball
+    glEndList()
+    return cube
 
-def remove_images(balls):
+class Spheres:
     '''
-    Removing uneccessary images that are not needed.
+    Draws many spheres from one unit sphere mesh kept on the GPU
+    The vertices (which are also the normals of a unit sphere) and the triangles are
+    put in buffer objects once. Every ball is then drawn from them with glTranslatef
+    and glScalef, so a frame only sends the position and radius of each ball and
+    OpenGL does the vertex transform. It needs an OpenGL context, make it after
+    pygame.display.set_mode.
     '''
-    for ball in balls:
-        ball.images = []                                          # Remove all images by setting to empty list
+    def __init__(self, slices=16, stacks=8):
+        theta = np.linspace(0, np.pi, stacks+1)                 # Angle from the north pole
+        phi = np.linspace(0, 2*np.pi, slices+1)                 # Angle around the axis
+        t, p = np.meshgrid(theta, phi, indexing='ij')
+        normals = np.stack([np.sin(t)*np.cos(p), np.sin(t)*np.sin(p), np.cos(t)], axis=-1).reshape(-1,3).astype(np.float32)
+        # Two triangles for every quad of the grid
+        k = np.arange(stacks)[:,None]*(slices+1) + np.arange(slices)[None,:]
+        quads = np.stack([k, k+1, k+slices+1, k+1, k+slices+2, k+slices+1], axis=-1)
+        triangles = quads.reshape(-1).astype(np.uint32)
+        self.count = len(triangles)                             # Number of indices of one sphere
+        self.vertices, self.indices = glGenBuffers(2)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vertices)
+        glBufferData(GL_ARRAY_BUFFER, normals.nbytes, normals, GL_STATIC_DRAW)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.indices)
+        glBufferData(GL_ELEMENT_ARRAY_BUFFER, triangles.nbytes, triangles, GL_STATIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+
+    def draw(self, pos, radius):
+        '''
+        Draw spheres at the positions pos (M,3) with the radii radius (M)
+        '''
+        if len(radius) == 0:
+            return
+        glColor3f(1,0,0)                                        # Put color
+        glEnable(GL_NORMALIZE)                                  # The normals are scaled with the mesh
+        glBindBuffer(GL_ARRAY_BUFFER, self.vertices)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.indices)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glEnableClientState(GL_NORMAL_ARRAY)
+        glVertexPointer(3, GL_FLOAT, 0, None)                   # Offsets into the bound buffers
+        glNormalPointer(GL_FLOAT, 0, None)
+        for (x, y, z), r in zip(pos.tolist(), radius.tolist()):
+            glPushMatrix()
+            glTranslatef(x, y, z)
+            glScalef(r, r, r)
+            glDrawElements(GL_TRIANGLES, self.count, GL_UNSIGNED_INT, None)
+            glPopMatrix()
+        glDisableClientState(GL_NORMAL_ARRAY)
+        glDisableClientState(GL_VERTEX_ARRAY)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glDisable(GL_NORMALIZE)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Bouncing balls viewer")
+    parser.add_argument("--fps", type=float, default=target_fps, help="Frames drawn per second at most")
+    parser.add_argument("--frames", type=int, default=None, help="Quit after drawing this many frames")
+    parser.add_argument("--screenshot", default=None, help="Save the last frame to this image file")
+    parser.add_argument("--profile", default=None, help="Append per-phase timings and counters as JSON lines to this file")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Simulation without rendering, the viewer only draws its state
+    sim = Simulation(N=N, L=L, initial_radius=initial_radius, final_volume_frac=final_volume_frac,
+                     hardCollision=hardCollision, increase_radius_hard=increase_radius_hard,
+                     eventDriven=eventDriven, frame_time=frame_time, adaptive_dt=adaptive_dt, init_method=init_method,
+                     profile=args.profile)
 
-def save_balls(balls):
-    '''
-    Save balls location in a locations.txt file
-    '''
-    with open('locations.txt','w') as f:
-        for ball in balls:
-            f.write(str(ball.radius) +" , " + str(ball.pos.x) + ' , ' + str(ball.pos.y) + ' , ' + str(ball.pos.z) + '\n')
-            for img in ball.images:
-                f.write(str(img.radius) +" , " + str(img.pos.x) + ' , ' + str(img.pos.y) + ' , ' + str(img.pos.z) + '\n')
-    return
-
-def main():
     # pygame Initialization
     pygame.init()
     display = (800,600)                                                     # Display size
+    pygame.display.gl_set_attribute(pygame.GL_DEPTH_SIZE, 24)               # Depth buffer so near balls hide far ones
     pygame.display.set_mode(display, DOUBLEBUF|OPENGL)                      # Rendering OpenGL in pygame
     
     # opengl Initialization
     gluPerspective(45, (display[0]/display[1]), 1, 50.0)
     glTranslatef(-0.5, -0.5, -4)                                            # Move the camera to the required position
     glRotatef(-20, 0, 1, 0)                                                 # Rotate the camera to the required position
-
-    # Initialize the balls with random positions and velocities
-    balls = []                                                              # List of balls
-    for i in range(N):
-            # Initialize the ball coordinates randomly
-            rand_x = random.uniform(0.1,0.9)
-            rand_y = random.uniform(0.1,0.9)
-            rand_z = random.uniform(0.1,0.9)
-            # Initialize the ball velocities randomly
-            rand_x_vel = random.uniform(-0.1,0.1)
-            rand_y_vel = random.uniform(-0.1,0.1)
-            rand_z_vel = random.uniform(-0.1,0.1)
-            # Add the ball to the list
-            balls.append(Ball(Vector3(rand_x,rand_y,rand_z), Vector3(rand_x_vel,rand_y_vel,rand_z_vel), initial_radius))
-
+    glEnable(GL_DEPTH_TEST)
+    glEnable(GL_CULL_FACE)                                                  # Only the front of the spheres is drawn
+    glEnable(GL_LIGHTING)
+    glEnable(GL_LIGHT0)
+    glEnable(GL_COLOR_MATERIAL)
+    glColorMaterial(GL_FRONT_AND_BACK, GL_AMBIENT_AND_DIFFUSE )
+    glClearColor(1, 1, 1, 1)
+    cube = Cube(L)                                                          # Geometry built once
+    spheres = Spheres()
+
+    frame_interval = 1/args.fps                                             # Seconds between two frames
+    last_frame = -frame_interval
+    frames = 0
     # Main Loop
     while True:
         for event in pygame.event.get():                       # Check for events and if quit is pressed exit the code
             if event.type == pygame.QUIT:
                 pygame.quit()
                 quit()
-        # glRotatef(1, 3, 1, 1)
 
         # Computaion of Algorithm
-        if not hardCollision:                                      # If the simulation is not hard collision
-        
-            tc, particles1 = Calculate_tc(balls,N)                 # Calculate the time of collision (Algorithm 4.2)
-            tr, particles2 = Calculate_tr(balls,N,L)                # Calculate the time of reflection (Algorithm 4.3)
-            del_t = 0.01                                            # Time step
-            del_t = min(tc,0.02)                                     # If collision occurs, take the minimum of the two
-            # Update the position and radius of the balls
-            for ball in balls:                                      # For each ball
-                ball.update(del_t)
-                ball.update_radius(del_t)                            
-            # Change the position of Balls
-            if del_t == tc:                                         
-                vel_i,vel_j = collosion_balls(particles1)             # Calculate the velocities of the balls after collision
-                # Update the velocities of the balls
-                particles1[0].vel = vel_i
-                particles1[1].vel = vel_j
-            # Change the position of Balls
-            collision_wall(balls,L)
-            # Generate the images of the balls
-            generate_images(balls,L)                                
-        
-        else :
-            hard_collision(balls,L)                             # If the simulation is hard collision            
-            del_t = 0.05
-            Calculate_tc(balls,N)
-            for ball in balls:                                  # For each ball
-                ball.update(del_t)                             # Update the position of the ball
-                if increase_radius_hard:                        # If the radius of the ball needs to be increased
-                    ball.update_radius(del_t)                  # Update the radius of the ball
-            
-
-        # Calculate the volume fraction of the box
-        volume = N*(4/3)*3.14*balls[0].radius**3
-        volume_frac = volume/(L**3)         
+        sim.step()
 
         # Condition for stopping the Simulation                    
-        if volume_frac > final_volume_frac: 
-            print("Program ended")
+        if sim.done:
+            print("Program ended" if sim.jamming.reason is None else "Program ended, jammed ({})".format(sim.jamming.reason))
 
             # If locations are to be Saved.
             if save_location:
-                save_balls(balls)
+                save_balls(sim.balls, L=sim.image_L)
+            sim.close()
             pygame.quit()
             quit()
             break
 
+        # The simulation keeps stepping until the next frame is due
+        now = time.perf_counter()
+        if now - last_frame < frame_interval:
+            continue
+        last_frame = now
+
         # For Rendering and Visualization using OpenGl
-        glEnable(GL_LIGHTING)
-        glEnable(GL_LIGHT0)
-        glEnable(GL_COLOR_MATERIAL)
-        glColorMaterial(GL_FRONT_AND_BACK, GL_AMBIENT_AND_DIFFUSE )
-        glClearColor(1, 1, 1, 1)
-        glClear(GL_COLOR_BUFFER_BIT|GL_DEPTH_BUFFER_BIT)
-    
-        for ball in balls:
-            # Rendering the Balls
-            Sphere(ball)
-        # Rendering the Box
-        Cube()
-        # Remove the images of the balls to avoid overlapping
-        remove_images(balls)
-        pygame.display.flip()
-        
-        pygame.time.wait(10)
-
-
-main()
\ No newline at end of file
+        pos, radius = sim.store.pos, sim.store.radius
+        if sim.image_L is not None:
+            # Also need to draw the images of the balls
+            with sim.profiler.phase('image_generation'):
+                image_pos, image_radius = image_arrays(pos, radius, sim.image_L)
+                pos = np.concatenate([pos, image_pos])
+                radius = np.concatenate([radius, image_radius])
+        with sim.profiler.phase('rendering'):
+            glClear(GL_COLOR_BUFFER_BIT|GL_DEPTH_BUFFER_BIT)
+            spheres.draw(pos, radius)                                       # Rendering the Balls
+            glDisable(GL_LIGHTING)
+            glCallList(cube)                                                # Rendering the Box
+            glEnable(GL_LIGHTING)
+            pygame.display.flip()
+        frames += 1
+
+        if args.frames is not None and frames >= args.frames:
+            if args.screenshot:
+                pixels = glReadPixels(0, 0, display[0], display[1], GL_RGB, GL_UNSIGNED_BYTE)
+                image = pygame.image.fromstring(pixels, display, 'RGB', True)
+                pygame.image.save(image, args.screenshot)
+            sim.close()
+            pygame.quit()
+            break
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import numpy as np
+from cell_list import CellList
+from vectorized import contact_roots, pair_terms, wall_times
+
+class StepController:
+    '''
+    Adaptive time step of the hard walls mode
+    The step ends when the first pair of balls overlaps, or the first ball passes a
+    wall, by overlap_tol times the smallest radius, so several contacts can be resolved
+    in one step but none deeper than that. The step stays between dt_min and dt_max.
+    Only pairs close enough to touch within dt_max are looked at, found with a CellList.
+    '''
+    def __init__(self, L, dt_min=1e-4, dt_max=0.5, overlap_tol=0.5):
+        if not 0 < overlap_tol <= 1:
+            # Deeper than a radius the shrunk balls of step would have negative radii
+            raise ValueError("overlap_tol must be in (0, 1], not {}".format(overlap_tol))
+        self.L = L                                       # Length of the box
+        self.dt_min = dt_min                             # Smallest step
+        self.dt_max = dt_max                             # Largest step
+        self.overlap_tol = overlap_tol                   # Deepest overlap in one step, in smallest radii
+
+    def near_pairs(self, pos, vel, radius, a):
+        '''
+        Pairs (i, j) that could touch within dt_max and whether each one touches now
+        '''
+        if len(pos) < 2:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=bool)
+        speed = np.sqrt(np.einsum('ij,ij->i', vel, vel)).max()
+        reach = 2*self.dt_max*(speed + np.abs(a).max())  # Two balls closing in on each other and growing
+        i, j = CellList(self.L, 2*radius.max() + reach).build(pos).pairs()
+        r = pos[i] - pos[j]
+        gap = np.sqrt(np.einsum('ij,ij->i', r, r)) - radius[i] - radius[j]
+        near = gap <= reach
+        return i[near], j[near], gap[near] <= 0
+
+    def step(self, pos, vel, radius, a, i, j):
+        '''
+        Time step for the near pairs (i, j), after their overlaps are resolved
+        Returns the step and the earliest time a pair or wall overlaps too deep
+        '''
+        # Balls shrunk by the allowed overlap touch when the real ones overlap that much
+        depth = self.overlap_tol*radius.min()
+        shrunk = radius - depth/2
+        limit = float('inf')
+        if len(i):
+            qa, qb, qc, r, v = pair_terms(pos, vel, shrunk, a, i, j)
+            times = contact_roots(qa, qb, qc)
+            # Already deeper: a pair the overlap correction left moving apart can go on, one
+            # still closing in (a growing pair that was not corrected) holds the step at dt_min
+            times[(qc <= 0) & (qb >= 0)] = np.inf
+            limit = float(times.min())
+        limit = min(limit, float(wall_times(pos, vel, radius - depth, a, self.L).min()))
+        return min(max(limit, self.dt_min), self.dt_max), limit
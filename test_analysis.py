@@ -0,0 +1,45 @@
+# Structure of hand-built configurations, run with python -m pytest
+
+import math
+import numpy as np
+import pytest
+from analysis import analyze, analyze_trajectory, lens_volume, pair_distances
+from trajectory import TrajectoryWriter
+
+def test_lens_volume():
+    # Inside, apart and two unit spheres one radius apart, pi (4R + d)(2R - d)^2 / 12
+    assert lens_volume(0.0, 1.0, 0.5)[()] == pytest.approx((4/3)*math.pi*0.5**3)
+    assert lens_volume(2.5, 1.0, 1.0)[()] == 0
+    assert lens_volume(1.0, 1.0, 1.0)[()] == pytest.approx(5*math.pi/12)
+
+def test_contacts_and_overlaps():
+    # 0 and 1 touch, 1 and 2 overlap by a quarter of the sum of their radii, 3 is alone
+    pos = np.array([[0.2, 0.5, 0.5], [0.4, 0.5, 0.5], [0.55, 0.5, 0.5], [0.9, 0.9, 0.9]])
+    result = analyze(pos, np.full(4, 0.1), 1, r_max=0.3, contact_tol=0.01)
+    assert result['contacts'].tolist() == [1, 2, 1, 0]
+    overlaps = result['overlaps']
+    assert overlaps['pairs'] == 1 and overlaps['balls'] == 2
+    assert overlaps['max_depth'] == pytest.approx(0.25) and overlaps['mean_depth'] == pytest.approx(0.25)
+    # Ball 3 only fills its own sphere of radius 4 radii
+    assert result['local_volume_frac'][3] == pytest.approx(1/64)
+
+def test_minimum_image_pairs_across_the_boundary():
+    pos = np.array([[0.02, 0.5, 0.5], [0.98, 0.5, 0.5]])
+    pairs = [(i.tolist(), j.tolist(), d.tolist()) for i, j, d in pair_distances(pos, 1, 0.1, periodic=True)]
+    assert sum(len(i) for i, _, _ in pairs) == 1
+    assert [d for _, _, ds in pairs for d in ds] == pytest.approx([0.04])
+    assert sum(len(i) for i, _, _ in pair_distances(pos, 1, 0.1)) == 0
+    assert analyze(pos, np.full(2, 0.03), 1, periodic=True)['overlaps']['pairs'] == 1
+    assert analyze(pos, np.full(2, 0.03), 1)['overlaps']['pairs'] == 0
+
+def test_analyze_trajectory(tmp_path):
+    path = str(tmp_path / 'run')
+    pos = np.array([[0.2, 0.5, 0.5], [0.35, 0.5, 0.5]])
+    with TrajectoryWriter(path, 2) as writer:
+        writer.write(0.0, pos, np.zeros((2,3)), np.full(2, 0.05))
+        writer.write(1.0, pos, np.zeros((2,3)), np.full(2, 0.1))
+    frames = list(analyze_trajectory(path))
+    assert [t for t, _ in frames] == [0.0, 1.0]
+    assert [result['overlaps']['pairs'] for _, result in frames] == [0, 1]
+    # The bins come from the radii of the last frame
+    assert frames[0][1]['r'].max() == frames[1][1]['r'].max() < 0.5
@@ -0,0 +1,38 @@
+# Parity of Calculate_tc_cells with Calculate_tc_np, run with python -m pytest
+
+import numpy as np
+import pytest
+from cell_list import CellList, Calculate_tc_cells
+from vectorized import Calculate_tc_np
+from test_vectorized import copy_store, make_store
+
+max_dt = 0.02
+
+@pytest.mark.parametrize('periodic', [False, True])
+@pytest.mark.parametrize('seed', range(10))
+@pytest.mark.parametrize('N,radius', [(2, 0.3), (10, 0.2), (40, 0.08), (200, 0.03), (500, 0.01)])
+def test_calculate_tc_cells_parity(periodic, seed, N, radius):
+    cells = make_store(N, radius, seed)
+    full = copy_store(cells)
+    cells_stats = {'overlap_corrections': 0, 'virial': 0.0}
+    full_stats = {'overlap_corrections': 0, 'virial': 0.0}
+    tc, particles = Calculate_tc_cells(cells.balls(), N, 1, periodic, max_dt, cells_stats)
+    tc_np, particles_np = Calculate_tc_np(full.balls(), N, 1 if periodic else None, full_stats)
+    # Only collisions within max_dt are guaranteed to be found
+    assert min(tc, max_dt) == pytest.approx(min(tc_np, max_dt), rel=1e-12, abs=1e-15)
+    if tc_np < max_dt:
+        assert [ball.index for ball in particles] == [ball.index for ball in particles_np]
+    assert cells_stats['overlap_corrections'] == full_stats['overlap_corrections']
+    assert cells_stats['virial'] == pytest.approx(full_stats['virial'], rel=1e-9, abs=1e-12)
+    np.testing.assert_allclose(cells.vel, full.vel, rtol=1e-12, atol=1e-12)
+
+def test_cases_cover_small_grids_and_overlaps():
+    # The large radii above give fewer than 3 cells per axis, the dense cases overlap
+    for N, radius in ((2, 0.3), (10, 0.2)):
+        for seed in range(10):
+            # The cutoff of Calculate_tc_cells is at least a diameter
+            assert CellList(1, 2*make_store(N, radius, seed).radius.max()).n < 3
+    stats = {'overlap_corrections': 0, 'virial': 0.0}
+    store = make_store(200, 0.03, 0)
+    Calculate_tc_cells(store.balls(), 200, 1, True, max_dt, stats)
+    assert stats['overlap_corrections'] > 0
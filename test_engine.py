@@ -0,0 +1,23 @@
+# Command line of the engine and the ensemble, run with python -m pytest
+
+import pytest
+import engine
+import ensemble
+
+@pytest.mark.parametrize('main', [engine.main, ensemble.main])
+def test_runs_that_never_end_are_refused(main, capsys):
+    with pytest.raises(SystemExit):
+        main([])
+    assert '--increase-radius-hard' in capsys.readouterr().err
+
+@pytest.mark.parametrize('argv', [['--max-steps', '5'], ['--no-hard-collision'], ['--increase-radius-hard'],
+                                  ['--initial-volume-frac', '0.3', '--final-volume-frac', '0.2']])
+def test_runs_that_end_are_accepted(argv):
+    args = engine.parse_args(argv)
+    assert args.max_steps == (5 if '--max-steps' in argv else None)
+
+@pytest.mark.parametrize('tol', ['0', '1.5'])
+def test_overlap_tol_out_of_range_is_refused(tol, capsys):
+    with pytest.raises(SystemExit):
+        engine.parse_args(['--max-steps', '5', '--overlap-tol', tol])
+    assert '--overlap-tol' in capsys.readouterr().err
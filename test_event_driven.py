@@ -0,0 +1,42 @@
+# Event driven scheduler checks, run with python -m pytest
+
+import numpy as np
+import pytest
+from event_driven import EventScheduler
+from initial import initial_configuration, radius_for_volume_frac
+
+def test_periodic_collision_through_the_wrap():
+    # The balls only meet across the boundary, after their nearest image changed
+    s = EventScheduler([[0.1,0.5,0.5], [0.9,0.5,0.5]], [[0.1,0,0], [0,0,0]], [0.05,0.05], [0,0], L=1, hard=False)
+    s.run_until(8)
+    pos, vel, radius = s.sync()
+    r = pos[0] - pos[1]
+    r -= np.round(r)
+    assert s.n_collisions == 1
+    assert np.linalg.norm(r) >= radius.sum() - 1e-12
+    np.testing.assert_allclose(vel[:,0], [0, 0.1], atol=1e-12)
+
+@pytest.mark.parametrize('hard', [True, False])
+def test_neighbour_lists_match_all_pairs(hard):
+    # A skin as large as the box lists every pair, the lists must not miss a collision
+    N = 60
+    radius = radius_for_volume_frac(N, 1, 0.2)
+    pos, vel = initial_configuration(N, 1, radius, seed=4, periodic=not hard)
+    args = (pos, vel, np.full(N, radius), np.full(N, 0.005), 1, hard)
+    s = EventScheduler(*args)
+    every = EventScheduler(*args, skin=1)
+    s.run_until(1)
+    every.run_until(1)
+    assert s.n_rebuilds > 0
+    assert len(s.flat) < N*(N - 1)
+    assert (s.n_collisions, s.n_walls) == (every.n_collisions, every.n_walls)
+    r = s.sync()[0] - every.sync()[0]
+    r -= np.round(r)
+    np.testing.assert_allclose(r, 0, atol=1e-9)
+
+def test_small_periodic_box_falls_back_to_all_pairs():
+    # Fewer than 3 cells along an axis, every ball is a candidate partner and the images are rechecked
+    s = EventScheduler([[0.2,0.5,0.5], [0.6,0.5,0.5]], [[-0.1,0,0], [0,0,0]], [0.15,0.15], [0,0], L=1, hard=False)
+    assert s.start is None
+    s.run_until(5)
+    assert s.n_collisions == 1
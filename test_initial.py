@@ -0,0 +1,41 @@
+# Initial configurations without overlaps, run with python -m pytest
+
+import numpy as np
+import pytest
+from cell_list import CellList
+from initial import initial_configuration, lattice_shape, radius_for_volume_frac
+from jamming import packing_fraction
+from vectorized import minimum_image
+
+def clear(pos, radius, L, periodic):
+    # No two balls overlap and with hard walls every ball is inside the box
+    i, j = CellList(L, 2*radius, periodic).build(pos).pairs()
+    r = pos[i] - pos[j]
+    if periodic:
+        r = minimum_image(r, L)
+    apart = (np.einsum('ij,ij->i', r, r) >= (2*radius)**2*(1 - 1e-12)).all()
+    return apart and (periodic or ((pos >= radius - 1e-12) & (pos <= L - radius + 1e-12)).all())
+
+@pytest.mark.parametrize('periodic', [True, False])
+@pytest.mark.parametrize('N', [20, 1000])
+def test_lattice_up_to_its_largest_fraction(periodic, N):
+    _, largest = lattice_shape(N, 1, periodic)
+    for frac in (0.3, 0.5, 0.6, packing_fraction(np.full(N, largest), 1)):
+        radius = radius_for_volume_frac(N, 1, frac)
+        if radius > largest:
+            with pytest.raises(ValueError, match='at most radius'):
+                initial_configuration(N, 1, radius, seed=1, method='lattice', periodic=periodic)
+        else:
+            pos, _ = initial_configuration(N, 1, radius, seed=1, method='lattice', periodic=periodic)
+            assert clear(pos, radius, 1, periodic)
+
+@pytest.mark.parametrize('periodic', [True, False])
+def test_lattice_reaches_0_6_for_1000_balls(periodic):
+    _, largest = lattice_shape(1000, 1, periodic)
+    assert packing_fraction(np.full(1000, largest), 1) > 0.6
+
+@pytest.mark.parametrize('periodic,frac', [(True, 0.33), (False, 0.25)])
+def test_rsa_up_to_the_documented_fraction(periodic, frac):
+    radius = radius_for_volume_frac(1000, 1, frac)
+    pos, _ = initial_configuration(1000, 1, radius, seed=0, method='rsa', periodic=periodic)
+    assert clear(pos, radius, 1, periodic)
@@ -0,0 +1,29 @@
+# Window and stop criteria of the JammingMonitor, run with python -m pytest
+
+from types import SimpleNamespace
+import numpy as np
+from jamming import JammingMonitor
+
+def sim(t, collisions, virial, N=10):
+    store = SimpleNamespace(vel=np.ones((N,3)), radius=np.full(N, 0.1))
+    return SimpleNamespace(t=t, collisions=collisions, stats={'overlap_corrections': 0, 'virial': virial},
+                           store=store, L=1)
+
+def test_window_is_counted_in_collisions_per_ball():
+    monitor = JammingMonitor(window=2, max_pressure=5)
+    monitor.update(sim(0.0, 0, 0.0), 0.0)
+    monitor.update(sim(1.0, 10, 100.0), 1.0)
+    assert not monitor.jammed()                      # One collision per ball so far
+    monitor.update(sim(1.5, 25, 200.0), 0.5)
+    assert monitor.jammed() and monitor.reason == 'pressure'
+    # 2.5 collisions per ball in 1.5 time units, kinetic 30 per unit time
+    assert np.isclose(monitor.collision_rate, 2.5/1.5)
+    assert np.isclose(monitor.pressure, 1 + 200/45)
+
+def test_old_samples_are_dropped():
+    monitor = JammingMonitor(window=2)
+    for k in range(100):
+        monitor.update(sim(float(k), 10*k, 0.0), 1.0)
+    # The newest sample and the one 2 collisions per ball before it
+    assert len(monitor.samples) == 3
+    assert monitor.samples[-1][1] - monitor.samples[0][1] == 2
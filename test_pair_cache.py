@@ -0,0 +1,68 @@
+# Cached collision times against the numpy method, run with python -m pytest
+
+import numpy as np
+import pytest
+from engine import Simulation
+from pair_cache import PairTimeCache
+from vectorized import Calculate_tc_np
+from test_vectorized import copy_store, make_store
+
+@pytest.mark.parametrize('N,radius', [(20, 0.1), (150, 0.03)])
+def test_hard_walls_without_growth_match_numpy(N, radius):
+    runs = {}
+    for method in ('numpy', 'cached'):
+        sim = Simulation(N=N, initial_radius=radius, seed=5, tc_method=method, max_steps=150).run()
+        sim.close()
+        runs[method] = sim
+    numpy_run, cached_run = runs['numpy'], runs['cached']
+    assert cached_run.stats['overlap_corrections'] == numpy_run.stats['overlap_corrections'] > 0
+    np.testing.assert_array_equal(cached_run.store.pos, numpy_run.store.pos)
+    np.testing.assert_array_equal(cached_run.store.vel, numpy_run.store.vel)
+
+@pytest.mark.parametrize('hard', [False, True])
+def test_growing_runs_match_numpy(hard):
+    runs = {}
+    for method in ('numpy', 'cached'):
+        sim = Simulation(N=150, initial_radius=0.03, seed=5, tc_method=method, hardCollision=hard,
+                         increase_radius_hard=True, max_steps=150).run()
+        sim.close()
+        runs[method] = sim
+    numpy_run, cached_run = runs['numpy'], runs['cached']
+    assert cached_run.stats['overlap_corrections'] == numpy_run.stats['overlap_corrections'] > 0
+    assert cached_run.collisions == numpy_run.collisions
+    np.testing.assert_allclose(cached_run.store.pos, numpy_run.store.pos, rtol=0, atol=1e-12)
+    np.testing.assert_allclose(cached_run.store.vel, numpy_run.store.vel, rtol=0, atol=1e-12)
+
+@pytest.mark.parametrize('periodic', [True, False])
+def test_predictions_match_numpy_between_overlap_corrections(periodic):
+    # Dense growing balls, every pair listed so the times past max_dt can be compared too.
+    # Pairs of corrected balls see the velocities the double loop sees at their place.
+    N = 200
+    store = make_store(N, 0.065, seed=3)
+    store.vel[:] *= 0.05
+    store.a[:] = 0.05
+    stores = copy_store(store), copy_store(store)
+    cache = PairTimeCache(N, 1, periodic, skin=1)
+    finite = 0
+    for step in range(5):
+        tc, particles = Calculate_tc_np(stores[0].balls(), N, 1 if periodic else None)
+        cached_tc, cached_particles = cache.predict(stores[1].balls(), N, step*0.01)
+        np.testing.assert_array_equal(stores[1].vel, stores[0].vel)
+        assert [b.index for b in cached_particles] == [b.index for b in particles]
+        if np.isfinite(tc):
+            finite += 1
+            assert cached_tc == pytest.approx(tc, rel=1e-12)
+        for s in stores:
+            s.update(0.01)
+            s.update_radius(0.01)
+            if periodic:
+                s.pos[:] %= 1
+    assert finite > 0
+
+def test_step_without_changes_computes_no_rows():
+    store = make_store(100, 0.01, seed=1)
+    cache = PairTimeCache(100, 1, True)
+    cache.predict(store.balls(), 100, 0.0)
+    rows = cache.rows
+    cache.predict(store.balls(), 100, 0.0)
+    assert cache.rows == rows
@@ -0,0 +1,60 @@
+# Slab decomposition of the parallel tc method, run with python -m pytest
+
+import numpy as np
+import pytest
+from engine import Simulation
+from parallel import SharedBallStore, Slab, SlabPool, colour
+from test_vectorized import copy_store, make_store
+
+@pytest.mark.parametrize('periodic', [False, True])
+@pytest.mark.parametrize('S', range(1, 8))
+def test_neighbouring_slabs_never_share_a_pass(periodic, S):
+    for k in range(S):
+        nb = (k + 1) % S if periodic else k + 1
+        if nb != k and nb < S:
+            assert colour(k, S, periodic) != colour(nb, S, periodic)
+
+@pytest.mark.parametrize('periodic', [False, True])
+def test_workers_resolve_like_the_passes_in_one_process(periodic):
+    N = 400
+    store = make_store(N, 0.03, seed=2)
+    shared = SharedBallStore(N)
+    for name in ('pos', 'vel', 'radius', 'a'):
+        getattr(shared, name)[:] = getattr(store, name)
+    pool = SlabPool(shared, 1, periodic, workers=5)
+    try:
+        S, cutoff = pool.slabs()
+        stats = {'overlap_corrections': 0, 'virial': 0.0}
+        tc, particles = pool.predict(shared.balls(), N, stats)
+    finally:
+        pool.close()
+        shared.close()
+    assert S > 2
+    # The same slabs and passes one after another
+    serial = copy_store(store)
+    slabs = [Slab(serial, 1, periodic) for k in range(S)]
+    for k in range(S):
+        slabs[k].pairs(k, S, cutoff)
+    serial_stats = {'overlap_corrections': 0, 'virial': 0.0}
+    for c in range(3):
+        for k in range(S):
+            if colour(k, S, periodic) == c:
+                slab_stats = slabs[k].resolve()
+                serial_stats['overlap_corrections'] += slab_stats['overlap_corrections']
+    assert stats['overlap_corrections'] == serial_stats['overlap_corrections'] > 0
+    np.testing.assert_array_equal(shared.vel, serial.vel)
+    serial_tc, i, j = min(slab.predict() for slab in slabs)
+    assert tc == serial_tc
+    if np.isfinite(tc):
+        assert [b.index for b in particles] == [i, j]
+
+def test_one_worker_resolves_like_numpy():
+    runs = []
+    for method in ('numpy', 'parallel'):
+        sim = Simulation(N=300, initial_radius=0.03, increase_radius_hard=True, seed=3, tc_method=method,
+                         slab_workers=1, max_steps=50, final_volume_frac=0.9).run()
+        sim.close()
+        runs.append(sim)
+    assert runs[0].stats['overlap_corrections'] == runs[1].stats['overlap_corrections'] > 0
+    np.testing.assert_array_equal(runs[0].store.vel, runs[1].store.vel)
+    np.testing.assert_array_equal(runs[0].store.pos, runs[1].store.pos)
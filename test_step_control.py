@@ -0,0 +1,52 @@
+# Adaptive time step of the hard walls mode, run with python -m pytest
+
+import numpy as np
+import pytest
+from engine import Simulation
+from step_control import StepController
+
+def two_balls(dx, vx):
+    # Two balls of radius 0.1 with centers dx apart, the first one moving at vx
+    pos = np.array([[0.4, 0.5, 0.5], [0.4 + dx, 0.5, 0.5]])
+    vel = np.array([[vx, 0.0, 0.0], [0.0, 0.0, 0.0]])
+    return pos, vel, np.full(2, 0.1), np.zeros(2)
+
+def test_step_ends_before_the_overlap_is_too_deep():
+    control = StepController(1, dt_min=1e-4, dt_max=0.5, overlap_tol=0.5)
+    pos, vel, radius, a = two_balls(0.3, 0.1)
+    del_t, limit = control.step(pos, vel, radius, a, np.array([0]), np.array([1]))
+    # The balls overlap by half a radius once 0.15 apart
+    assert np.isclose(limit, 1.5) and np.isclose(del_t, 0.5)
+
+def test_deep_pair_closing_in_holds_the_step():
+    control = StepController(1, dt_min=1e-4, dt_max=0.5, overlap_tol=0.5)
+    pos, vel, radius, a = two_balls(0.12, 0.1)
+    del_t, limit = control.step(pos, vel, radius, a, np.array([0]), np.array([1]))
+    assert limit == 0 and del_t == control.dt_min
+
+def test_deep_pair_moving_apart_does_not_limit_the_step():
+    control = StepController(1, dt_min=1e-4, dt_max=0.5, overlap_tol=0.5)
+    pos, vel, radius, a = two_balls(0.12, -0.1)
+    del_t, limit = control.step(pos, vel, radius, a, np.array([0]), np.array([1]))
+    assert del_t == control.dt_max
+
+def test_overlap_tol_is_at_most_a_radius():
+    for tol in (0, -0.5, 1.5):
+        with pytest.raises(ValueError):
+            StepController(1, overlap_tol=tol)
+    StepController(1, overlap_tol=1)
+
+def test_near_pairs_are_found_after_the_overlaps_are_resolved():
+    # The step has to be limited with the pairs near under the corrected velocities
+    sim = Simulation(N=200, initial_radius=0.05, seed=2, init_method='rsa', adaptive_dt=True,
+                     tc_method='cells', max_steps=40)
+    control = sim.step_control
+    step = control.step
+    checked = []
+    def checking_step(pos, vel, radius, a, i, j):
+        expected, expected_j, _ = control.near_pairs(pos, vel, radius, a)
+        checked.append(np.array_equal(i, expected) and np.array_equal(j, expected_j))
+        return step(pos, vel, radius, a, i, j)
+    control.step = checking_step
+    sim.run()
+    assert sim.stats['overlap_corrections'] > 0 and all(checked)
@@ -0,0 +1,33 @@
+# Binary trajectories of the engine, run with python -m pytest
+
+import numpy as np
+import pytest
+from engine import Simulation
+from trajectory import TrajectoryReader, TrajectoryWriter
+
+def test_fresh_run_refuses_an_existing_trajectory(tmp_path):
+    path = str(tmp_path / 'run')
+    Simulation(N=5, seed=1, max_steps=3, trajectory=path).run().close()
+    assert len(TrajectoryReader(path)) == 4
+    with pytest.raises(ValueError, match='not empty'):
+        Simulation(N=5, seed=2, max_steps=3, trajectory=path)
+    assert len(TrajectoryReader(path)) == 4
+
+def test_resume_continues_the_trajectory(tmp_path):
+    path, checkpoint = str(tmp_path / 'run'), str(tmp_path / 'run.pkl')
+    sim = Simulation(N=5, seed=1, max_steps=6, trajectory=path, checkpoint=checkpoint, checkpoint_interval=2)
+    for _ in range(3):
+        sim.step()
+    sim.close()
+    Simulation.resume(checkpoint).run().close()
+    reference = str(tmp_path / 'reference')
+    Simulation(N=5, seed=1, max_steps=6, trajectory=reference).run().close()
+    np.testing.assert_array_equal(TrajectoryReader(path).pos, TrajectoryReader(reference).pos)
+
+def test_writer_appends_only_when_asked(tmp_path):
+    path = str(tmp_path / 'run')
+    with TrajectoryWriter(path, 2) as writer:
+        writer.write(0.0, np.zeros((2,3)), np.zeros((2,3)), np.ones(2))
+    with TrajectoryWriter(path, 2, append=True) as writer:
+        writer.write(1.0, np.zeros((2,3)), np.zeros((2,3)), np.ones(2))
+    assert TrajectoryReader(path).time.tolist() == [0.0, 1.0]
@@ -0,0 +1,87 @@
+# Parity of the NumPy kernels with the scalar ones, run with python -m pytest
+
+import math
+import numpy as np
+import pytest
+from utilities import BallStore, Calculate_tc, Calculate_tr, collision_wall, hard_collision
+from vectorized import Calculate_tc_np, Calculate_tr_np, collision_wall_np, hard_collision_np
+
+def make_store(N, radius, seed, L=1):
+    '''
+    Seeded random balls, dense enough that some of them overlap
+    '''
+    rng = np.random.default_rng(seed)
+    store = BallStore(N)
+    store.pos[:] = rng.uniform(0, L, (N,3))
+    store.vel[:] = rng.uniform(-0.1, 0.1, (N,3))
+    store.radius[:] = radius*rng.uniform(0.8, 1.2, N)
+    store.a[:] = rng.uniform(0, 0.02, N)
+    return store
+
+def copy_store(store):
+    copy = BallStore(len(store))
+    copy.pos[:] = store.pos
+    copy.vel[:] = store.vel
+    copy.radius[:] = store.radius
+    copy.a[:] = store.a
+    return copy
+
+@pytest.mark.parametrize('L', [None, 1])
+@pytest.mark.parametrize('seed', range(20))
+@pytest.mark.parametrize('N,radius', [(2, 0.3), (10, 0.1), (40, 0.08), (60, 0.04)])
+def test_calculate_tc_parity(L, seed, N, radius):
+    scalar = make_store(N, radius, seed)
+    vector = copy_store(scalar)
+    scalar_stats = {'overlap_corrections': 0, 'virial': 0.0}
+    vector_stats = {'overlap_corrections': 0, 'virial': 0.0}
+    tc, particles = Calculate_tc(scalar.balls(), N, L, scalar_stats)
+    tc_np, particles_np = Calculate_tc_np(vector.balls(), N, L, vector_stats)
+    if math.isinf(tc):
+        assert math.isinf(tc_np) and particles_np == []
+    else:
+        assert tc_np == pytest.approx(tc, rel=1e-9, abs=1e-12)
+        assert [ball.index for ball in particles_np] == [ball.index for ball in particles]
+    # Overlapping pairs are resolved in the same order with the same velocities
+    assert vector_stats['overlap_corrections'] == scalar_stats['overlap_corrections']
+    assert vector_stats['virial'] == pytest.approx(scalar_stats['virial'], rel=1e-9, abs=1e-12)
+    np.testing.assert_allclose(vector.vel, scalar.vel, rtol=1e-12, atol=1e-12)
+
+def test_overlapping_configurations_are_covered():
+    # The dense cases above must actually resolve overlaps in both boxes
+    for L in (None, 1):
+        stats = {'overlap_corrections': 0, 'virial': 0.0}
+        store = make_store(40, 0.08, 0)
+        Calculate_tc_np(store.balls(), 40, L, stats)
+        assert stats['overlap_corrections'] > 0
+
+@pytest.mark.parametrize('seed', range(10))
+def test_wall_parity(seed):
+    scalar = make_store(50, 0.1, seed)
+    scalar.pos[:] = np.random.default_rng(seed).uniform(-0.2, 1.2, (50,3))   # Some balls past the walls
+    vector = copy_store(scalar)
+    assert hard_collision(scalar.balls(), 1) == hard_collision_np(vector.balls(), 1)
+    np.testing.assert_array_equal(vector.pos, scalar.pos)
+    np.testing.assert_array_equal(vector.vel, scalar.vel)
+    scalar.pos[:] = vector.pos[:] = np.random.default_rng(seed + 100).uniform(-0.2, 1.2, (50,3))
+    collision_wall(scalar.balls(), 1)
+    collision_wall_np(vector.balls(), 1)
+    np.testing.assert_array_equal(vector.pos, scalar.pos)
+
+@pytest.mark.parametrize('seed', range(20))
+@pytest.mark.parametrize('N,radius', [(1, 0.1), (10, 0.1), (60, 0.04)])
+def test_calculate_tr_parity(seed, N, radius):
+    store = make_store(N, radius, seed)
+    if seed % 2:
+        store.a[:] = 0                                   # Without growth some balls never reach a wall
+    tr, particles = Calculate_tr(store.balls(), N, 1)
+    tr_np, particles_np = Calculate_tr_np(store.balls(), N, 1)
+    assert tr_np == pytest.approx(tr, rel=1e-12, abs=1e-15)
+    assert [ball.index for ball in particles_np] == [ball.index for ball in particles]
+
+def test_calculate_tr_without_a_wall_in_reach():
+    store = BallStore(1)
+    store.pos[:] = 0.5
+    store.radius[:] = 0.1
+    store.a[:] = 0
+    assert Calculate_tr(store.balls(), 1, 1) == (float('inf'), [])
+    assert Calculate_tr_np(store.balls(), 1, 1) == (float('inf'), [])
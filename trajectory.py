@@ -0,0 +1,117 @@
+import json
+import os
+import numpy as np
+
+# Arrays stored for every frame and the shape of one frame for N balls
+fields = {
+    'time': lambda N: (),
+    'radius': lambda N: (N,),
+    'pos': lambda N: (N,3),
+    'vel': lambda N: (N,3),
+}
+
+class TrajectoryWriter:
+    '''
+    Append-only binary trajectory in a directory
+    Every field is a raw float64 file that grows by one frame per snapshot and
+    meta.json holds the number of balls and the box. With append an existing
+    trajectory is continued, otherwise the directory has to be empty or new so a
+    fresh run never mixes its frames with those of another one.
+    '''
+    def __init__(self, path, N, L=1, periodic=False, interval=1, append=False):
+        self.path = path                                 # Directory of the trajectory
+        self.N = N                                       # Number of balls
+        self.interval = interval                         # Steps between two snapshots
+        self.files = {}                                  # Open field files
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, 'meta.json')
+        if not append and os.listdir(path):
+            raise ValueError("Trajectory directory {} is not empty, use a new one or resume from a checkpoint "
+                             "to continue it".format(path))
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta['N'] != N:
+                raise ValueError("Trajectory {} has {} balls, not {}".format(path, meta['N'], N))
+            self.frames = TrajectoryReader(path).frames  # Number of frames in the files
+            self.truncate(self.frames)                   # Drop a frame that was only partly written
+        else:
+            with open(meta_path, 'w') as f:
+                json.dump({'N': N, 'L': L, 'periodic': periodic, 'dtype': 'float64'}, f)
+            self.frames = 0
+        self.files = {name: open(os.path.join(path, name + '.bin'), 'ab') for name in fields}
+
+    def truncate(self, frames):
+        '''
+        Keep only the first frames of the trajectory, used when resuming from a checkpoint
+        '''
+        self.flush()
+        for name, shape in fields.items():
+            with open(os.path.join(self.path, name + '.bin'), 'a+b') as f:
+                f.truncate(frames*8*int(np.prod(shape(self.N))))
+        self.frames = frames
+
+    def write(self, t, pos, vel, radius):
+        '''
+        Append one frame
+        '''
+        self.files['time'].write(np.float64(t).tobytes())
+        np.ascontiguousarray(radius, dtype=np.float64).tofile(self.files['radius'])
+        np.ascontiguousarray(pos, dtype=np.float64).tofile(self.files['pos'])
+        np.ascontiguousarray(vel, dtype=np.float64).tofile(self.files['vel'])
+        self.frames += 1
+
+    def record(self, step, t, pos, vel, radius):
+        '''
+        Append a frame if the step is a multiple of the snapshot interval
+        '''
+        if step % self.interval == 0:
+            self.write(t, pos, vel, radius)
+
+    def flush(self):
+        for f in self.files.values():
+            f.flush()
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class TrajectoryReader:
+    '''
+    Memory-mapped view of a trajectory written by TrajectoryWriter
+    time[k], radius[k], pos[k] and vel[k] are frame k. Nothing is read from the
+    disk until a slice of the arrays is used.
+    '''
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.N = self.meta['N']                          # Number of balls
+        self.L = self.meta['L']                          # Length of the box
+        self.periodic = self.meta['periodic']            # Periodic box, else hard walls
+        # Complete frames in every file
+        self.frames = min(os.path.getsize(os.path.join(path, name + '.bin')) // (8*int(np.prod(shape(self.N))))
+                          for name, shape in fields.items())
+        for name, shape in fields.items():
+            setattr(self, name, self.map(name, shape(self.N)))
+
+    def map(self, name, shape):
+        if self.frames == 0:
+            return np.empty((0,) + shape)
+        return np.memmap(os.path.join(self.path, name + '.bin'), dtype=np.float64, mode='r',
+                         shape=(self.frames,) + shape)
+
+    def __len__(self):
+        return self.frames
+
+    def __getitem__(self, k):
+        '''
+        Frame k as (time, radius, pos, vel)
+        '''
+        return self.time[k], self.radius[k], self.pos[k], self.vel[k]
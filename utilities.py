@@ -1,11 +1,12 @@
 import math
-from OpenGL.GL import images
 import numpy as np
 
 class Vector3:
     '''
     3D Vector class for use in physics simulations
     '''
+    __slots__ = ('x', 'y', 'z')
+
     def __init__(self, x, y, z):
         self.x = x                                 # x coordinate
         self.y = y                                 # y coordinate
@@ -37,21 +38,152 @@ class Vector3:
         return math.sqrt((self.x - other.x)**2 + (self.y - other.y)**2 + (self.z - other.z)**2)
     def norm(self):
         # Normalize the vector
-        return Vector3(self.x / self.mag(), self.y / self.mag(), self.z / self.mag())
+        m = self.mag()
+        return Vector3(self.x / m, self.y / m, self.z / m)
     def __str__(self):
         # String representation of the vector
         return "Vector3({}, {}, {})".format(self.x, self.y, self.z)
 
+class RowVector(Vector3):
+    '''
+    Vector3 view of one row of an (N,3) array, writes go to the array
+    '''
+    __slots__ = ('array', 'index')
+
+    def __init__(self, array, index):
+        self.array = array                         # (N,3) array holding the vector
+        self.index = index                         # Row of the vector
+
+    @property
+    def x(self):
+        return self.array.item(self.index, 0)
+    @x.setter
+    def x(self, value):
+        self.array[self.index, 0] = value
+    @property
+    def y(self):
+        return self.array.item(self.index, 1)
+    @y.setter
+    def y(self, value):
+        self.array[self.index, 1] = value
+    @property
+    def z(self):
+        return self.array.item(self.index, 2)
+    @z.setter
+    def z(self, value):
+        self.array[self.index, 2] = value
+
+class BallStore:
+    '''
+    State of many balls as a structure of arrays, the balls are views into it
+    '''
+    __slots__ = ('pos', 'vel', 'radius', 'a', 'scratch')
+
+    def __init__(self, N):
+        self.pos = np.zeros((N,3))                    # Positions of the balls
+        self.vel = np.zeros((N,3))                    # Velocities of the balls
+        self.radius = np.zeros(N)                     # Radii of the balls
+        self.a = np.full(N, 0.01)                     # Rates of change of radius
+        self.scratch = np.zeros((N,3))                # Work array so the updates do not allocate
+
+    def __len__(self):
+        return len(self.radius)
+
+    def balls(self):
+        '''
+        One Ball view for every ball in the store
+        '''
+        return [Ball(store=self, index=i) for i in range(len(self))]
+
+    def update(self, dt):
+        '''
+        Update the positions of all balls in place
+        '''
+        np.multiply(self.vel, dt, out=self.scratch)
+        self.pos += self.scratch
+
+    def update_radius(self, dt):
+        '''
+        Update the radii of all balls in place
+        '''
+        tmp = self.scratch[:,0]
+        np.multiply(self.a, dt, out=tmp)
+        self.radius += tmp
+
+def shared_store(balls):
+    '''
+    The BallStore of the balls if they are exactly the balls of one store, in order
+    '''
+    if not balls:
+        return None
+    store = balls[0].store
+    if store is None or len(store) != len(balls):
+        return None
+    for i, ball in enumerate(balls):
+        if ball.store is not store or ball.index != i:
+            return None
+    return store
+
+def ball_lists(balls):
+    '''
+    Positions and velocities as lists of [x, y, z] and radii and growth rates as lists,
+    so the scalar loops work on plain floats instead of a view per attribute access.
+    Taken from the arrays in one go if the balls are the views of one BallStore.
+    '''
+    store = shared_store(balls)
+    if store is not None:
+        return store.pos.tolist(), store.vel.tolist(), store.radius.tolist(), store.a.tolist()
+    return ([[ball.pos.x, ball.pos.y, ball.pos.z] for ball in balls],
+            [[ball.vel.x, ball.vel.y, ball.vel.z] for ball in balls],
+            [ball.radius for ball in balls], [ball.a for ball in balls])
+
 class Ball:
     '''
     Class for a ball in a 3D environment
+    The state lives in a BallStore, a ball made on its own is a FreeBall holding its
+    state in plain attributes
     '''
-    def __init__(self, pos, vel, radius):
-        self.pos = pos                                # Position of the ball
-        self.vel = vel                                # Velocity of the ball
-        self.radius = radius                          # Radius of the ball
-        self.a = 0.01                                 # Rate of change of radius
-        self.images = [None for i in range(6)]        # Images of the ball
+    __slots__ = ('store', 'index')
+
+    def __new__(cls, pos=None, vel=None, radius=None, store=None, index=0):
+        if store is None and cls is Ball:
+            cls = FreeBall
+        return object.__new__(cls)
+
+    def __init__(self, pos=None, vel=None, radius=None, store=None, index=0):
+        self.store = store                            # Arrays holding the state of the ball
+        self.index = index                            # Index of the ball in the store
+        if pos is not None:
+            self.pos = pos                            # Position of the ball
+        if vel is not None:
+            self.vel = vel                            # Velocity of the ball
+        if radius is not None:
+            self.radius = radius                      # Radius of the ball
+
+    @property
+    def pos(self):
+        return RowVector(self.store.pos, self.index)
+    @pos.setter
+    def pos(self, value):
+        self.store.pos[self.index] = (value.x, value.y, value.z)
+    @property
+    def vel(self):
+        return RowVector(self.store.vel, self.index)
+    @vel.setter
+    def vel(self, value):
+        self.store.vel[self.index] = (value.x, value.y, value.z)
+    @property
+    def radius(self):
+        return self.store.radius.item(self.index)
+    @radius.setter
+    def radius(self, value):
+        self.store.radius[self.index] = value
+    @property
+    def a(self):
+        return self.store.a.item(self.index)      # Rate of change of radius
+    @a.setter
+    def a(self, value):
+        self.store.a[self.index] = value
     
     def __str__(self):
         '''
@@ -63,7 +195,11 @@ class Ball:
         '''
         Update the ball's position and velocity
         '''
-        self.pos = self.pos.add(self.vel.mul(dt))
+        x, y, z = self.store.vel[self.index].tolist()
+        pos = self.store.pos[self.index]
+        pos[0] += x*dt
+        pos[1] += y*dt
+        pos[2] += z*dt
     
     def update_radius(self, dt):
         '''
@@ -71,235 +207,254 @@ class Ball:
         '''
         self.radius = self.radius + self.a * dt
 
-def Calculate_tc(balls,N):
+class FreeBall(Ball):
+    '''
+    Ball outside of any BallStore, like the temporary images of generate_images
+    '''
+    __slots__ = ('pos', 'vel', 'radius', 'a')
+
+    def __init__(self, pos=None, vel=None, radius=None, store=None, index=0):
+        self.store = None
+        self.index = 0
+        self.pos = pos if pos is not None else Vector3(0, 0, 0)     # Position of the ball
+        self.vel = vel if vel is not None else Vector3(0, 0, 0)     # Velocity of the ball
+        self.radius = radius if radius is not None else 0.0         # Radius of the ball
+        self.a = 0.01                                               # Rate of change of radius
+
+    def update(self, dt):
+        '''
+        Update the ball's position and velocity
+        '''
+        self.pos = self.pos.add(self.vel.mul(dt))
+
+def position(ball):
+    '''
+    Position of a ball as a tuple of floats, read from its store row if it has one
+    '''
+    if ball.store is None:
+        pos = ball.pos
+        return pos.x, pos.y, pos.z
+    return tuple(ball.store.pos[ball.index].tolist())
+
+def velocity(ball):
+    '''
+    Plain Vector3 copy of the velocity of a ball, read from its store row if it has one
+    '''
+    if ball.store is None:
+        return Vector3(ball.vel.x, ball.vel.y, ball.vel.z)
+    return Vector3(*ball.store.vel[ball.index].tolist())
+
+def Calculate_tc(balls,N,L=None,stats=None):
     '''
     Algorithm 4.2 
+    If L is given the balls are in a periodic box and the minimum image is used
+    If stats is given stats['overlap_corrections'] counts the overlapping pairs resolved
+    and stats['virial'] adds up r_ij . dv_i of their velocity changes
     '''
     tc = float('inf')
     particles = []
+    pos, vel, radius, growth = ball_lists(balls[:N])
     for i in range(N):
+        xi, yi, zi = pos[i]
         for j in range(i+1,N):
-            ball_i = balls[i]
-            ball_j = balls[j]
-            if i == j:                             # If it is the same ball
-                continue
-            elif ball_i.pos.distance(ball_j.pos) <= ball_i.radius + ball_j.radius:
+            xj, yj, zj = pos[j]
+            rx, ry, rz = xi - xj, yi - yj, zi - zj
+            if L is not None:
+                # Nearest periodic image of ball_j
+                rx, ry, rz = rx - L*round(rx/L), ry - L*round(ry/L), rz - L*round(rz/L)
+            R = radius[i] + radius[j]
+            vix, viy, viz = vel[i]
+            vjx, vjy, vjz = vel[j]
+            if math.sqrt(rx**2 + ry**2 + rz**2) <= R:
                 # If the balls are colliding
-                if ball_i.vel.sub(ball_j.vel).dot(ball_i.pos.sub(ball_j.pos)) > 0:
+                if (vix - vjx)*rx + (viy - vjy)*ry + (viz - vjz)*rz > 0:
                     # If the balls are moving away from each other
                     continue
                 # Update the velocities of the balls
+                ball_i = balls[i]
+                ball_j = balls[j]
                 vel_i,vel_j =  collosion_balls((ball_i, ball_j))
+                if stats is not None:
+                    stats['overlap_corrections'] += 1
+                    stats['virial'] += rx*(vel_i.x - vix) + ry*(vel_i.y - viy) + rz*(vel_i.z - viz)
                 ball_i.vel = vel_i
                 ball_j.vel = vel_j
+                vel[i] = [vel_i.x, vel_i.y, vel_i.z]
+                vel[j] = [vel_j.x, vel_j.y, vel_j.z]
             else:
                 # If the balls are not colliding
                 # Equation 4.2 and 4.4 from the pdf
-                r = ball_i.pos.sub(ball_j.pos)
-                v = ball_i.vel.sub(ball_j.vel)
-                a = v.dot(v)-(ball_i.a+ball_j.a)**2
-                b = r.dot(v) - (ball_i.a+ball_j.a)*(ball_i.radius+ball_j.radius)
-                c = r.dot(r) - (ball_i.radius+ball_j.radius)**2
+                vx, vy, vz = vix - vjx, viy - vjy, viz - vjz
+                A = growth[i] + growth[j]
+                a = vx*vx + vy*vy + vz*vz - A**2
+                b = rx*vx + ry*vy + rz*vz - A*R
+                c = rx*rx + ry*ry + rz*rz - R**2
                 # Calculate the time of collision
                 if (b<=0 or a<0) and (b-a*c)>0:
                     temp_tc = (-b - math.sqrt(b**2 - a*c))/a
                     if temp_tc < tc:
                         tc = temp_tc
-                        particles = [ball_i, ball_j]
+                        particles = [balls[i], balls[j]]
     return tc, particles
 
 def collosion_balls(particles):
     '''
     Updating the Velocitites of the balls after a collision
     '''
-    del_r = particles[0].vel.sub(particles[1].vel)
+    # Plain copies read from the store, the velocities of the balls are views
+    ball_i, ball_j = particles
+    vel_i = velocity(ball_i)
+    vel_j = velocity(ball_j)
+    a = ball_i.a + ball_j.a
+    del_r = vel_i.sub(vel_j)
     u = del_r.div(del_r.mag())
     # from Algorithm 4.4 in pdf, formulas to Calculate the new velocities of the balls
-    vel_i_parllel = u.mul(u.dot(particles[0].vel))
-    vel_j_parllel = u.mul(u.dot(particles[1].vel))
-    vel_i_perp = particles[0].vel.sub(vel_i_parllel)
-    vel_j_perp = particles[1].vel.sub(vel_j_parllel)
-    vel_i_new = vel_i_perp.add(vel_j_parllel.add(u.mul(particles[0].a+particles[1].a)))
-    vel_j_new = vel_j_perp.add(vel_i_parllel.add(u.mul(particles[1].a+particles[0].a)))
+    vel_i_parllel = u.mul(u.dot(vel_i))
+    vel_j_parllel = u.mul(u.dot(vel_j))
+    vel_i_perp = vel_i.sub(vel_i_parllel)
+    vel_j_perp = vel_j.sub(vel_j_parllel)
+    vel_i_new = vel_i_perp.add(vel_j_parllel.add(u.mul(a)))
+    vel_j_new = vel_j_perp.add(vel_i_parllel.add(u.mul(a)))
     return vel_i_new, vel_j_new
 
 def Calculate_tr(balls,N,L):
     '''
-    Algorithm 4.2 
+    Algorithm 4.3
+    Time until the first ball touches a wall of the box of length L while moving and
+    growing, a wall only counts if the ball closes in on it
     '''
     tr = float('inf')
     particles = []
-    # ms and ind can be neglected as they are not used in the algorithm
-    ms = [0 for i in range(N)]
-    ind = -1
     for i in range(N):
         ball_i = balls[i]
-        if ball_i.pos.x > ball_i.radius:                                 # If the ball is not in the left wall
-            temp_tr = (ball_i.pos.x - ball_i.radius)/(ball_i.vel.x-ball_i.a)  # Calculate the time of collision
-            if temp_tr < tr:                                           # If the time of collision is less than the current time of collision
-                tr = temp_tr                                          # Update the time of collision
-                particles = [ball_i]                                 # Update the particles
-                ms[i] += 1 
-                ind = i
-        if ball_i.pos.y > ball_i.radius:                                # If the ball is not in the bottom wall
-            temp_tr = (ball_i.pos.y - ball_i.radius)/(ball_i.vel.y-ball_i.a) # Calculate the time of collision
-            if temp_tr < tr:                                          # If the time of collision is less than the current time of collision
-                tr = temp_tr                                         # Update the time of collision
-                particles = [ball_i]                                # Update the particles
-                ms[i] += 1 
-                ind = i
-        if ball_i.pos.z > ball_i.radius:                               # If the ball is not in the back wall
-            temp_tr = (ball_i.pos.z - ball_i.radius)/(ball_i.vel.z-ball_i.a) 
-            if temp_tr < tr:                                         
-                tr = temp_tr                                       
-                particles = [ball_i] 
-                ms[i] += 1
-                ind = i
-        if ball_i.pos.x < 1-ball_i.radius:                            # If the ball is not in the right wall
-            temp_tr = (L-ball_i.pos.x - ball_i.radius)/(ball_i.vel.x+ball_i.a)
-            if temp_tr < tr:
-                tr = temp_tr
-                particles = [ball_i]
-                ms[i] += 1
-                ind = i
-        if ball_i.pos.y < 1-ball_i.radius:                            # If the ball is not in the top wall
-            temp_tr = (L-ball_i.pos.y - ball_i.radius)/(ball_i.vel.y+ball_i.a)
-            if temp_tr < tr:
-                tr = temp_tr
-                particles = [ball_i]
-                ms[i] += 1
-                ind = i
-        if ball_i.pos.z < 1-ball_i.radius:                            # If the ball is not in the front wall
-            temp_tr = (L-ball_i.pos.z - ball_i.radius)/(ball_i.vel.z+ball_i.a)
-            if temp_tr < tr:
-                tr = temp_tr
-                particles = [ball_i]
-                ms[i] += 1
-                ind = i
-        # if len(ball_i.images) == 0:
-        #     generate_images([ball_i],L)
+        pos = ball_i.pos
+        vel = ball_i.vel
+        radius = ball_i.radius
+        a = ball_i.a
+        for x, v in ((pos.x, vel.x), (pos.y, vel.y), (pos.z, vel.z)):
+            if x > radius and a - v > 0:                             # Closing in on the left/bottom/back wall
+                temp_tr = (x - radius)/(a - v)
+                if temp_tr < tr:
+                    tr = temp_tr
+                    particles = [ball_i]
+            if x < L - radius and v + a > 0:                         # Closing in on the right/top/front wall
+                temp_tr = (L - x - radius)/(v + a)
+                if temp_tr < tr:
+                    tr = temp_tr
+                    particles = [ball_i]
     return tr, particles
 
-def generate_images(balls,L):
-    m = 0
-    '''
-    For each ball generating necessary images
-    '''
-    for ball in balls:
-        x = 0       # How much the ball's image has moved in the x direction
-        y = 0       # How much the ball's image has moved in the y direction
-        z = 0       # How much the ball's image has moved in the z direction
-        # Calculating the how many images are needed from algorithm 4.5 in pdf
-        if ball.pos.x < ball.radius:              # If the ball is in the left side of the box
-            m += 1                                # Add one wall
-            x = L                                 # Set the x position of the image to the right side of the box
-        if ball.pos.y < ball.radius:             # If the ball is in the bottom side of the box
-            m += 1
-            y = L
-        if ball.pos.z < ball.radius:            # If the ball is in the back side of the box
-            m += 1
-            z = L
-        if ball.pos.x > L-ball.radius:         # If the ball is in the right side of the box
-            m += 1
-            x = -L
-        if ball.pos.y > L-ball.radius:        # If the ball is in the top side of the box
-            m += 1
-            y = -L
-        if ball.pos.z > L-ball.radius:       # If the ball is in the front side of the box
-            m += 1
-            z = -L
-        if m == 1:
-            # If only one image is needed
-            img = Ball(ball.pos.add(Vector3(x,y,z)), ball.vel, ball.radius)
-            ball.images.append(img)
-        elif m == 2:
-            # If 3 images are needed
-            if x == 0:
-                # if not touching the left and right wall
-                img1 = Ball(ball.pos.add(Vector3(0,y,0)), ball.vel, ball.radius)        # down image
-                img2 = Ball(ball.pos.add(Vector3(0,0,z)), ball.vel, ball.radius)        # back image
-                img3 = Ball(ball.pos.add(Vector3(0,y,z)), ball.vel, ball.radius)        # back-down image
-            elif y == 0:
-                # if not touching the top and bottom wall
-                img1 = Ball(ball.pos.add(Vector3(x,0,0)), ball.vel, ball.radius)       # right image
-                img2 = Ball(ball.pos.add(Vector3(x,0,z)), ball.vel, ball.radius)       # right-back image
-                img3 = Ball(ball.pos.add(Vector3(0,0,z)), ball.vel, ball.radius)       # back image
-            elif z == 0:
-                # if not touching the front and back wall
-                img1 = Ball(ball.pos.add(Vector3(x,y,0)), ball.vel, ball.radius)     # right-down image
-                img2 = Ball(ball.pos.add(Vector3(0,y,0)), ball.vel, ball.radius)     # down image
-                img3 = Ball(ball.pos.add(Vector3(x,0,0)), ball.vel, ball.radius)     # right image
-            ball.images.append(img1)
-            ball.images.append(img2)
-            ball.images.append(img3)
-        elif m == 3:
-            # If 8 images are needed
-            # Each corner has a ball' image total of 8 balls.
-            img1 = Ball(ball.pos.add(Vector3(x,y,0)), ball.vel, ball.radius)
-            img2 = Ball(ball.pos.add(Vector3(0,y,0)), ball.vel, ball.radius)
-            img3 = Ball(ball.pos.add(Vector3(x,0,0)), ball.vel, ball.radius)
-            img4 = Ball(ball.pos.add(Vector3(0,0,z)), ball.vel, ball.radius)
-            img5 = Ball(ball.pos.add(Vector3(x,0,z)), ball.vel, ball.radius)
-            img6 = Ball(ball.pos.add(Vector3(0,y,z)), ball.vel, ball.radius)
-            img7 = Ball(ball.pos.add(Vector3(x,y,z)), ball.vel, ball.radius)
-            ball.images.append(img1)
-            ball.images.append(img2)
-            ball.images.append(img3)
-            ball.images.append(img4)
-            ball.images.append(img5)
-            ball.images.append(img6)
-            ball.images.append(img7)
+def image_offsets(ball,L):
+    '''
+    Shifts of the periodic images a ball needs (algorithm 4.5 in pdf)
+    A ball touching m walls needs 2**m - 1 images: 1 at a face, 3 at an edge and 7 at a corner
+    '''
+    x, y, z = position(ball)
+    r = ball.radius
+    if r <= x <= L - r and r <= y <= L - r and r <= z <= L - r:
+        return []                                # Away from every wall, no images
+    shifts = []
+    for x in (x, y, z):
+        if x < r:                                # If the ball is in the lower side of the box
+            shifts.append((0, L))                # the image is on the upper side
+        elif x > L - r:                          # If the ball is in the upper side of the box
+            shifts.append((0, -L))               # the image is on the lower side
+        else:
+            shifts.append((0,))
+    return [(x, y, z) for x in shifts[0] for y in shifts[1] for z in shifts[2] if (x, y, z) != (0, 0, 0)]
+
+def image_positions(ball,L):
+    '''
+    Positions of the periodic images of a ball, only computed when they are asked for
+    '''
+    offsets = image_offsets(ball,L)
+    if offsets:
+        x0, y0, z0 = position(ball)
+        for x, y, z in offsets:
+            yield Vector3(x0 + x, y0 + y, z0 + z)
 
+def generate_images(ball,L):
+    '''
+    Image balls of a ball in the periodic box
+    '''
+    offsets = image_offsets(ball,L)
+    if not offsets:
+        return []
+    x0, y0, z0 = position(ball)
+    vel, radius = ball.vel, ball.radius
+    return [FreeBall(Vector3(x0 + x, y0 + y, z0 + z), vel, radius) for x, y, z in offsets]
 
 def collision_wall(balls,L=1):
     '''
     Updating Velocities of balls
     '''
-    for ball in balls:
-        if ball.pos.x < 0:                                  # If it goes beyond left wall
-            ball.pos.x += L                                 # move to right wall
+    store = shared_store(balls)
+    if store is not None:
+        # Only the balls outside the box are looked at
+        out = np.flatnonzero(((store.pos < 0) | (store.pos > L)).any(axis=1))
+        balls = [balls[i] for i in out.tolist()]
+        pos = store.pos[out].tolist()
+    else:
+        pos = [(ball.pos.x, ball.pos.y, ball.pos.z) for ball in balls]
+    for ball, (x, y, z) in zip(balls, pos):
+        if 0 <= x <= L and 0 <= y <= L and 0 <= z <= L:
+            continue                                        # Inside the box, nothing to write back
 
-        if ball.pos.y < 0:                                  # If it goes beyond bottom wall
-            ball.pos.y += L                                 # move to top wall
+        if x < 0:                                           # If it goes beyond left wall
+            x += L                                          # move to right wall
 
-        if ball.pos.z < 0:                                 # If it goes beyond back wall
-            ball.pos.z += L                                   # move to front wall
+        if y < 0:                                           # If it goes beyond bottom wall
+            y += L                                          # move to top wall
 
-        if ball.pos.x > L:                                 # If it goes beyond right wall
-            ball.pos.x -= L                                # move to left wall
+        if z < 0:                                           # If it goes beyond back wall
+            z += L                                          # move to front wall
 
-        if ball.pos.y > L:                                # If it goes beyond top wall
-            ball.pos.y -= L                               # move to bottom wall
+        if x > L:                                           # If it goes beyond right wall
+            x -= L                                          # move to left wall
 
-        if ball.pos.z > L:                               # If it goes beyond front wall
-            ball.pos.z -= L                              # move to back wall
-        
+        if y > L:                                           # If it goes beyond top wall
+            y -= L                                          # move to bottom wall
+
+        if z > L:                                           # If it goes beyond front wall
+            z -= L                                          # move to back wall
+
+        ball.pos = Vector3(x, y, z)
     return
 
 def hard_collision(balls,L):
     """
     Updating Velocities of balls
+    Returns the number of reflections
     """
-    for ball in balls:
-        if ball.pos.x > L - ball.radius:                 #right wall
-            ball.pos.x = L - ball.radius                 
-            ball.vel.x = -ball.vel.x                     #reflecting
-        if ball.pos.x < ball.radius:                      #left wall
-            ball.pos.x = ball.radius
-            ball.vel.x = -ball.vel.x                     #reflecting
-        if ball.pos.y > L - ball.radius:                  #top wall
-            ball.pos.y = L - ball.radius
-            ball.vel.y = -ball.vel.y                       #reflecting
-        if ball.pos.y < ball.radius:                      #bottom wall
-            ball.pos.y = ball.radius
-            ball.vel.y = -ball.vel.y                       #reflecting
-        if ball.pos.z > L - ball.radius:                   #back wall
-            ball.pos.z = L - ball.radius
-            ball.vel.z = -ball.vel.z                      #reflecting
-        if ball.pos.z < ball.radius:                      #front wall
-            ball.pos.z = ball.radius
-            ball.vel.z = -ball.vel.z
-    return
+    reflections = 0
+    store = shared_store(balls)
+    if store is not None:
+        # Only the balls touching a wall are looked at
+        radius = store.radius[:,None]
+        near = np.flatnonzero(((store.pos > L - radius) | (store.pos < radius)).any(axis=1))
+        balls = [balls[i] for i in near.tolist()]
+        pos, vel, radius = store.pos[near].tolist(), store.vel[near].tolist(), store.radius[near].tolist()
+    else:
+        pos, vel, radius, a = ball_lists(balls)
+    for ball, p, v, r in zip(balls, pos, vel, radius):
+        x, y, z = p
+        if r <= x <= L - r and r <= y <= L - r and r <= z <= L - r:
+            continue                                     # Away from the walls, nothing to write back
+        hits = 0
+        for k in range(3):                               # x, y and z
+            if p[k] > L - r:                             # right/top/back wall
+                p[k] = L - r
+                v[k] = -v[k]                             # reflecting
+                hits += 1
+            if p[k] < r:                                 # left/bottom/front wall
+                p[k] = r
+                v[k] = -v[k]                             # reflecting
+                hits += 1
+        if hits:
+            ball.pos = Vector3(*p)
+            ball.vel = Vector3(*v)
+            reflections += hits
+    return reflections
 
 # Vertices of the Cube
 verticies = (
@@ -0,0 +1,257 @@
+import numpy as np
+from utilities import Vector3, collosion_balls, shared_store
+
+def balls_to_arrays(balls):
+    '''
+    State of a list of balls as contiguous NumPy arrays
+    Returns positions (N,3), velocities (N,3), radii (N) and growth rates (N). If the
+    balls are the views of one BallStore its arrays are returned without a copy.
+    '''
+    store = shared_store(balls)
+    if store is not None:
+        return store.pos, store.vel, store.radius, store.a
+    N = len(balls)
+    pos = np.empty((N,3))
+    vel = np.empty((N,3))
+    radius = np.empty(N)
+    a = np.empty(N)
+    for i, ball in enumerate(balls):
+        pos[i] = (ball.pos.x, ball.pos.y, ball.pos.z)
+        vel[i] = (ball.vel.x, ball.vel.y, ball.vel.z)
+        radius[i] = ball.radius
+        a[i] = ball.a
+    return pos, vel, radius, a
+
+def arrays_to_balls(balls, pos, vel, radius):
+    '''
+    Write positions, velocities and radii from arrays back into the balls
+    '''
+    store = shared_store(balls)
+    if store is not None:
+        store.pos[:] = pos
+        store.vel[:] = vel
+        store.radius[:] = radius
+        return
+    for i, ball in enumerate(balls):
+        ball.pos = Vector3(*pos[i].tolist())
+        ball.vel = Vector3(*vel[i].tolist())
+        ball.radius = float(radius[i])
+
+def minimum_image(r, L):
+    '''
+    Shortest periodic displacement for separation vectors r in a box of length L
+    '''
+    return r - L*np.round(r/L)
+
+def image_arrays(pos, radius, L):
+    '''
+    Positions and radii of the periodic images of all balls (algorithm 4.5 in pdf)
+    A ball near a wall is shifted by L away from it, balls near an edge or corner get
+    every combination of the shifts
+    '''
+    shift = np.where(pos < radius[:,None], L, 0.0) - np.where(pos > L - radius[:,None], L, 0.0)
+    images = []
+    image_radius = []
+    for mask in ((1,0,0), (0,1,0), (0,0,1), (1,1,0), (1,0,1), (0,1,1), (1,1,1)):
+        mask = np.array(mask, dtype=bool)
+        need = (shift[:,mask] != 0).all(axis=1)
+        images.append(pos[need] + shift[need]*mask)
+        image_radius.append(radius[need])
+    return np.concatenate(images), np.concatenate(image_radius)
+
+def pair_terms(pos, vel, radius, a, i, j, L=None):
+    '''
+    Coefficients of |r + v t|^2 = (R + A t)^2 for all the pairs (i[k], j[k]) at once,
+    written as qa t^2 + 2 qb t + qc = 0. Returns (qa, qb, qc, r, v)
+    If L is given the separation uses the minimum image of the periodic box
+    '''
+    r = pos[i] - pos[j]
+    if L is not None:
+        r = minimum_image(r, L)
+    v = vel[i] - vel[j]
+    a_sum = a[i] + a[j]
+    r_sum = radius[i] + radius[j]
+    qa = np.einsum('ij,ij->i', v, v) - a_sum**2
+    qb = np.einsum('ij,ij->i', r, v) - a_sum*r_sum
+    qc = np.einsum('ij,ij->i', r, r) - r_sum**2
+    return qa, qb, qc, r, v
+
+def pair_times(pos, vel, radius, a, i, j, L=None):
+    '''
+    Equation 4.2 and 4.4 from the pdf evaluated for all the pairs (i[k], j[k]) at once
+    Returns the earliest root for every pair, inf where the pair does not collide
+    If L is given the separation uses the minimum image of the periodic box
+    '''
+    qa, qb, qc, r, v = pair_terms(pos, vel, radius, a, i, j, L)
+    disc = qb**2 - qa*qc
+    # Same condition as the scalar Calculate_tc
+    ok = ((qb <= 0) | (qa < 0)) & (qb - qa*qc > 0) & (disc >= 0) & (qa != 0)
+    tc = np.full(len(qa), np.inf)
+    tc[ok] = (-qb[ok] - np.sqrt(disc[ok]))/qa[ok]
+    return tc
+
+def contact_times(pos, vel, radius, a, i, j, L=None):
+    '''
+    Time until the pairs (i[k], j[k]) first touch, 0 if they already touch and inf if
+    they never do. Unlike pair_times every pair closing in on each other gets its root.
+    '''
+    qa, qb, qc, r, v = pair_terms(pos, vel, radius, a, i, j, L)
+    return contact_roots(qa, qb, qc)
+
+def contact_roots(qa, qb, qc):
+    '''
+    contact_times from the coefficients returned by pair_terms
+    '''
+    disc = qb**2 - qa*qc
+    apart = qc > 0
+    ok = apart & (((qb < 0) & (disc >= 0)) | (qa < 0))
+    t = np.full(len(qa), np.inf)
+    # Stable form of (-b - sqrt(b^2 - ac))/a
+    t[ok] = qc[ok]/(np.sqrt(np.maximum(disc[ok], 0)) - qb[ok])
+    t[~apart] = 0.0
+    return t
+
+def overlapping_pairs(pos, radius, i, j, L=None):
+    '''
+    Mask of the pairs (i[k], j[k]) that are touching or overlapping
+    '''
+    r = pos[i] - pos[j]
+    if L is not None:
+        r = minimum_image(r, L)
+    return np.einsum('ij,ij->i', r, r) <= (radius[i] + radius[j])**2
+
+def resolve_pairs(balls, pos, vel, radius, a, i, j, L=None, stats=None):
+    '''
+    Resolve the overlapping pairs in order, exactly like the scalar Calculate_tc does,
+    and predict the collision time of every other pair. The pairs between two overlaps
+    are predicted as one batch so every prediction sees the same velocities the scalar
+    loop would have seen. Returns the collision time of every pair.
+    '''
+    touching = np.flatnonzero(overlapping_pairs(pos, radius, i, j, L))
+    tc = np.full(len(i), np.inf)
+    start = 0
+    for k in touching.tolist() + [len(i)]:
+        if k > start:
+            tc[start:k] = pair_times(pos, vel, radius, a, i[start:k], j[start:k], L)
+        if k == len(i):
+            break
+        start = k + 1
+        resolve_overlap(balls, pos, vel, int(i[k]), int(j[k]), L, stats)
+    return tc
+
+def resolve_overlap(balls, pos, vel, p, q, L=None, stats=None):
+    '''
+    Collide the overlapping balls p and q unless they already move apart, like Calculate_tc
+    '''
+    r = pos[p] - pos[q]
+    if L is not None:
+        r = minimum_image(r, L)
+    if np.dot(vel[p] - vel[q], r) > 0:
+        # If the balls are moving away from each other
+        return
+    # Update the velocities of the balls
+    vel_i,vel_j = collosion_balls((balls[p], balls[q]))
+    if stats is not None:
+        stats['overlap_corrections'] += 1
+        stats['virial'] += float(np.dot(r, (vel_i.x, vel_i.y, vel_i.z) - vel[p]))
+    balls[p].vel = vel_i
+    balls[q].vel = vel_j
+    vel[p] = (vel_i.x, vel_i.y, vel_i.z)
+    vel[q] = (vel_j.x, vel_j.y, vel_j.z)
+
+def predict_pairs(balls, pos, vel, radius, a, i, j, L=None, stats=None):
+    '''
+    resolve_pairs returning (tc, particles) for the earliest collision
+    '''
+    tc = resolve_pairs(balls, pos, vel, radius, a, i, j, L, stats)
+    if len(tc) == 0:
+        return float('inf'), []
+    k = int(np.argmin(tc))
+    if not np.isfinite(tc[k]):
+        return float('inf'), []
+    return float(tc[k]), [balls[i[k]], balls[j[k]]]
+
+def Calculate_tc_np(balls,N,L=None,stats=None):
+    '''
+    Algorithm 4.2 using batched NumPy operations over all N(N-1)/2 pairs
+    Same (tc, particles) contract as Calculate_tc, with the minimum image if L is given
+    '''
+    if N < 2:
+        return float('inf'), []
+    pos, vel, radius, a = balls_to_arrays(balls[:N])
+    i, j = np.triu_indices(N, 1)                              # All pairs in the order of the scalar loop
+    return predict_pairs(balls, pos, vel, radius, a, i, j, L, stats)
+
+def wall_times(pos, vel, radius, a, L):
+    '''
+    Algorithm 4.3 for every ball and wall at once
+    Returns an (N,6) array with the time for each ball to touch the lower and the upper
+    wall of every axis, inf where the ball is already touching it or does not close in
+    '''
+    lower_gap = pos - radius[:,None]
+    upper_gap = L - pos - radius[:,None]
+    lower_speed = a[:,None] - vel
+    upper_speed = vel + a[:,None]
+    times = np.full((len(pos), 6), np.inf)
+    np.divide(lower_gap, lower_speed, out=times[:,0::2], where=(lower_gap > 0) & (lower_speed > 0))
+    np.divide(upper_gap, upper_speed, out=times[:,1::2], where=(upper_gap > 0) & (upper_speed > 0))
+    return times
+
+def Calculate_tr_np(balls,N,L):
+    '''
+    Algorithm 4.3 using NumPy over all balls, same (tr, particles) contract as Calculate_tr
+    '''
+    if N < 1:
+        return float('inf'), []
+    pos, vel, radius, a = balls_to_arrays(balls[:N])
+    first = wall_times(pos, vel, radius, a, L).min(axis=1)
+    k = int(np.argmin(first))
+    if not np.isfinite(first[k]):
+        return float('inf'), []
+    return float(first[k]), [balls[k]]
+
+def reflect_walls(pos, vel, radius, L):
+    '''
+    Hard walls on arrays, in place: balls past a wall are put back against it and their
+    velocity along that axis is reversed. Returns the number of reflections
+    The upper wall of an axis is checked before the lower one like in hard_collision.
+    '''
+    r = radius[:,None]
+    upper = pos > L - r
+    pos[upper] = np.broadcast_to(L - r, pos.shape)[upper]
+    vel[upper] *= -1
+    lower = pos < r
+    pos[lower] = np.broadcast_to(r, pos.shape)[lower]
+    vel[lower] *= -1
+    return int(upper.sum() + lower.sum())
+
+def wrap_positions(pos, L):
+    '''
+    Periodic walls on arrays, in place: balls past a wall re-enter from the opposite one
+    '''
+    pos[pos < 0] += L
+    pos[pos > L] -= L
+
+def hard_collision_np(balls,L):
+    '''
+    hard_collision using NumPy, returns the number of reflections
+    '''
+    store = shared_store(balls)
+    if store is not None:
+        return reflect_walls(store.pos, store.vel, store.radius, L)
+    pos, vel, radius, a = balls_to_arrays(balls)
+    reflections = reflect_walls(pos, vel, radius, L)
+    arrays_to_balls(balls, pos, vel, radius)
+    return reflections
+
+def collision_wall_np(balls,L=1):
+    '''
+    collision_wall using NumPy
+    '''
+    store = shared_store(balls)
+    if store is not None:
+        wrap_positions(store.pos, L)
+        return
+    pos, vel, radius, a = balls_to_arrays(balls)
+    wrap_positions(pos, L)
+    arrays_to_balls(balls, pos, vel, radius)